@@ -18,4 +18,5 @@
 
 __all__ = ["app", "frame", "game", "canvas", "leveledit", "editor",
            "common", "dialogs", "stbar", "input", "palette", "defaults",
-           "objects"]
+           "objects", "scheduler", "events", "solver", "levelset",
+           "recording", "replay", "rng"]
@@ -21,15 +21,18 @@
 
 from pathlib import Path
 from random import Random
-from typing import Literal, List, Optional
+from typing import Any, Callable, Literal, List, Optional, Tuple, Union
 
 from gi.repository import GObject
 
-from kye.common import tryopen, KYEPATHS
+from kye.common import findfile
 from kye.defaults import KyeDefaults
 from kye.frame import KFrame
+from kye.events import KEvent
 from kye.game import KGame, KGameFormatError
-from kye.input import KyeRecordedInput, KDemoFormatError, KDemoFileMismatch
+from kye.recording import KyeRecordedInput, KDemoFormatError, KDemoFileMismatch
+from kye.levelset import KLevelSet
+from kye.rng import KRandom
 
 
 class KyeApp:
@@ -49,8 +52,17 @@ class KyeApp:
         self.__recto: Optional[Path] = None
         self.__playback: Optional[Path] = None
         self.__game: Optional[KGame] = None
+        self.__levels: Optional[KLevelSet] = None  # the level set playfile
+        self.__complete = False
         self.__frame: Optional[KFrame] = None
         self.__defaults = defaults
+        self.__seeds = Random()  # seeds for the random numbers of each game
+
+        # The recording being played back, if it can be sought in, and the
+        # state of the game at its start.
+        self.__playing: Optional[KyeRecordedInput] = None
+        self.__start_state: tuple = ()
+        self.__watching: List[Tuple[KEvent, Callable[..., Any]]] = []
 
     def run(self, frame: KFrame) -> None:
         """Run the application. You must supply a 'KFrame' for the UI."""
@@ -79,7 +91,7 @@ class KyeApp:
             assert self.__game is not None   # for mypy
             assert self.__frame is not None  # for mypy
             # Check if the level has been completed.
-            if self.__game.diamonds == 0:
+            if self.__complete:
                 self.__gamestate = "between levels"
                 msg = self.__game.exitmsg
                 if self.__frame.moveinput.is_recording():
@@ -88,14 +100,13 @@ class KyeApp:
                     msg = "Playback complete."
                 self.__frame.endleveldialog(self.__game.nextlevel, msg)
 
-            # If we are still playing, run a gametick and update the screen.
+            # If we are still playing, run a gametick; the screen and
+            # status bar are updated by the game's events as it runs.
             if self.__gamestate == "playing level":
                 self.__game.dotick()
-                self.__frame.canvas.game_redraw(self.__game,
-                                                self.__game.invalidate)
-                self.__frame.stbar.update(diamonds=self.__game.diamonds)
-                if self.__game.thekye is not None:
-                    self.__frame.stbar.update(kyes=self.__game.thekye.lives)
+                self.__frame.moveinput.tick(self.__game)
+                if self.__playing is not None:
+                    self.__frame.timeline_position(self.__game.tics)
 
         # And tell glib knows that we want this timer event to keep occurring.
         return True
@@ -109,13 +120,14 @@ class KyeApp:
         self.__frame.extra_title(None)
 
         # If recording this game, open the file to record to & tell the input system about it
-        rng = Random()
+        seed = self.__seeds.getrandbits(64)
+        rng: Union[Random, KRandom] = KRandom(seed)
         try:
             if self.__recto:
                 self.__frame.moveinput.record_to(self.__recto,
                                                  playfile=self.__playfile,
                                                  playlevel=self.__playlevel,
-                                                 rng=rng)
+                                                 seed=seed)
         except IOError:
             self.__frame.error_message(
                 message="Failed to write to %s " % self.__recto)
@@ -132,7 +144,7 @@ class KyeApp:
                 move_source = KyeRecordedInput(self.__playfile,
                                                self.__playback)
                 self.__playlevel = move_source.get_level()
-                move_source.set_rng(rng)
+                rng = move_source.make_rng()
                 self.__frame.extra_title("Replay")
             except KDemoFileMismatch as e:
                 self.__frame.error_message(message="Recording is for %s; you must load this level set first" % e.filename)
@@ -144,16 +156,33 @@ class KyeApp:
 
         # Now try loading the actual level
         try:
-            gamefile = tryopen(self.__playfile, KYEPATHS)
+            # The level set is indexed when first opened, so that restarts
+            # and moving between levels go straight to the level.
+            if self.__levels is None:
+                self.__levels = KLevelSet(findfile(self.__playfile))
 
             # Create the game state object.
-            self.__game = KGame(gamefile, want_level=self.__playlevel,
-                                movesource=move_source, rng=rng)
+            self.__game = game = KGame(self.__levels,
+                                       want_level=self.__playlevel,
+                                       movesource=move_source, rng=rng)
+            self.__watch(game)
+
+            # Recordings which say how long they are can be sought in, from
+            # the start of the game or from their keyframes.
+            self.__playing = None
+            if isinstance(move_source, KyeRecordedInput) and move_source.ticks > 0:
+                self.__playing = move_source
+                self.__start_state = game.snapshot()
+                self.__frame.show_timeline(move_source.ticks)
+            else:
+                self.__frame.hide_timeline()
 
             # And remember that we have reached this level.
             self.__defaults.add_known(self.__playfile, self.__game.thislev)
 
-            # UI updates - level name in window title, hint in the status bar.
+            # UI updates - board size, level name in window title, hint in
+            # the status bar.
+            self.__frame.set_board_size(self.__game.width, self.__game.height)
             self.__frame.level_title(self.__game.thislev)
             self.__frame.stbar.update(hint=self.__game.hint,
                                       levelnum=self.__game.levelnum)
@@ -171,6 +200,60 @@ class KyeApp:
         else:
             self.__gamestate = ""
 
+    def __watch(self, game: KGame) -> None:
+        """Subscribe the display to the events of a new game."""
+        assert self.__frame is not None  # for mypy
+        frame = self.__frame
+
+        def redraw(squares):
+            frame.canvas.game_redraw(game, squares)
+
+        def level_complete():
+            self.__complete = True
+
+        self.__watching = [
+            (KEvent.REDRAW, redraw),
+            (KEvent.LEVEL_COMPLETE, level_complete),
+            (KEvent.DIAMOND,
+             lambda diamonds: frame.stbar.update(diamonds=diamonds)),
+            (KEvent.KYE_DIED, lambda lives: frame.stbar.update(kyes=lives))]
+        for event, callback in self.__watching:
+            game.subscribe(event, callback)
+
+        # A level with no diamonds at all is complete straight away.
+        self.__complete = game.diamonds == 0
+        frame.stbar.update(diamonds=game.diamonds)
+        if game.thekye is not None:
+            frame.stbar.update(kyes=game.thekye.lives)
+
+    def __unwatch(self, game: KGame) -> None:
+        """Undo __watch, so that the game runs without being displayed."""
+        for event, callback in self.__watching:
+            game.unsubscribe(event, callback)
+        self.__watching = []
+
+    def seek(self, tick: int) -> None:
+        """Jump to the given tick of the recording being played back."""
+        game = self.__game
+        source = self.__playing
+        if game is None or source is None or self.__gamestate != "playing level":
+            return
+        assert self.__frame is not None  # for mypy
+        try:
+            state = source.seek(tick)
+        except KDemoFormatError:
+            self.__frame.error_message(message="This recording is damaged")
+            return
+
+        # Play on from the keyframe to the tick wanted, as fast as
+        # possible, then show the game as it is there.
+        self.__unwatch(game)
+        game.restore(self.__start_state if state is None else state)
+        while game.tics < tick and game.diamonds > 0:
+            game.dotick()
+        self.__watch(game)
+        self.__frame.timeline_position(game.tics)
+
     def restart(self,
                 recordto: Optional[Path] = None,
                 demo: Optional[Path] = None) -> None:
@@ -193,6 +276,9 @@ class KyeApp:
         self.__playfile = fname
         self.__playlevel = ""
         self.__gamestate = "starting level"
+        if self.__levels is not None:
+            self.__levels.close()
+            self.__levels = None
 
     def known_levels(self) -> List[str]:
         """Returns a list of levels that the player knows about from this level set."""
@@ -19,7 +19,7 @@
 
 """kye.canvas - module containing the KCanvas class, which implements the display of the game itself."""
 
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Optional, Tuple
 
 import gi
 gi.require_version("Gtk", "3.0")
@@ -32,14 +32,14 @@ from kye.game import KGame
 
 class KCanvas(Gtk.DrawingArea):
     """A gtk DrawingArea which draws the game."""
-    tilesize = 16
 
     def __init__(self, responder, tilesize=16) -> None:
         Gtk.DrawingArea.__init__(self)
 
         # Remember the tilesize, and set the canvas size appropriately.
-        KCanvas.tilesize = tilesize
-        self.set_size_request(KCanvas.tilesize*XSIZE, KCanvas.tilesize*YSIZE)
+        self.tilesize = tilesize
+        self.bwidth, self.bheight = XSIZE, YSIZE
+        self.set_size_request(self.tilesize*XSIZE, self.tilesize*YSIZE)
 
         # Set GTK window flags & expose handler.
         self.set_events(Gdk.EventMask.EXPOSURE_MASK
@@ -79,29 +79,34 @@ class KCanvas(Gtk.DrawingArea):
         self.images: Dict[str, GdkPixbuf.Pixbuf] = {}
 
         # Set up array holding the on-screen state.
-        self.showboard = []
-        for i in range(XSIZE * YSIZE):
-            self.showboard.append("blank")
+        self.showboard = ["blank"] * (XSIZE * YSIZE)
+
+    def set_board_size(self, width: int, height: int) -> None:
+        """Sets the size of the board being displayed, in tiles; causes the canvas to resize and be redrawn."""
+        self.bwidth, self.bheight = width, height
+        self.showboard = ["blank"] * (width * height)
+        self.set_size_request(self.tilesize*width, self.tilesize*height)
+        self.queue_draw()
 
-    def game_redraw(self, game: KGame, changed_squares: List[Optional[int]]) -> None:
+    def game_redraw(self, game: KGame, changed_squares: Iterable[Tuple[int, int]]) -> None:
         """Update the displayed game from the game in memory (e.g. after a game tick has run).
 
         game  -- the game object (we call get_tile on this to get the new state.
-        changed_squares -- array containing true/false values to indicate which squares (may) have changed since the last rendering. Note that this is flattened, so it contains values for (0,0), (1,0), ..., (30,0), (0, 1), ... etc.
+        changed_squares -- the (x, y) squares which (may) have changed since the last rendering, e.g. from KGame.take_dirty. Only these are looked at, so there is no work to do after a tick where nothing changed.
 
-        Note that changed_squares is updated back to false for all tiles as they are queued for redrawing.
+        If the game's board is a different size to the one displayed, the canvas is resized first.
         """
-        i = -1
-        for y in range(YSIZE):
-            for x in range(XSIZE):
-                i = i + 1
-                if changed_squares[i] == 1:
-                    changed_squares[i] = None
-                    tile = game.get_tile(x, y)
-                    if tile != self.showboard[XSIZE*y+x]:
-                        self.showboard[XSIZE*y+x] = tile
-                        self.queue_draw_area(self.tilesize*x, self.tilesize*y,
-                                             self.tilesize, self.tilesize)
+        width, height = game.width, game.height
+        if width != self.bwidth or height != self.bheight:
+            self.set_board_size(width, height)
+        showboard = self.showboard
+        tilesize = self.tilesize
+        for x, y in changed_squares:
+            tile = game.get_tile(x, y)
+            if tile != showboard[width*y+x]:
+                showboard[width*y+x] = tile
+                self.queue_draw_area(tilesize*x, tilesize*y,
+                                     tilesize, tilesize)
 
     def get_image(self, tilename: str,
                   tilesize: Optional[int] = None) -> GdkPixbuf.Pixbuf:
@@ -112,10 +117,10 @@ class KCanvas(Gtk.DrawingArea):
         """
         # Use current tilesize by default.
         if tilesize is None:
-            tilesize = KCanvas.tilesize
+            tilesize = self.tilesize
 
         # Use cached image data if available.
-        if tilesize == KCanvas.tilesize and tilename in self.images:
+        if tilesize == self.tilesize and tilename in self.images:
             return self.images[tilename]
         else:
             image_data = self.imgdir.get_tile(tilename)
@@ -139,15 +144,17 @@ class KCanvas(Gtk.DrawingArea):
             pb = pb.add_alpha(False, 0, 0, 0)
 
             # Cache if this is the useful size for us.
-            if tilesize == KCanvas.tilesize:
+            if tilesize == self.tilesize:
                 self.images[tilename] = pb
             return pb
 
     def settilesize(self, size: int) -> None:
         """Sets the size for tiles; causes the canvas to resize and be redrawn."""
-        KCanvas.tilesize = size
-        self.set_size_request(self.tilesize*XSIZE, self.tilesize*YSIZE)
-        self.queue_draw_area(0, 0, self.tilesize*XSIZE, self.tilesize*YSIZE)
+        self.tilesize = size
+        self.set_size_request(self.tilesize*self.bwidth,
+                              self.tilesize*self.bheight)
+        self.queue_draw_area(0, 0, self.tilesize*self.bwidth,
+                             self.tilesize*self.bheight)
 
         # And must flush the tile cache; need to redraw from the image data at
         # the new tile size.
@@ -155,7 +162,7 @@ class KCanvas(Gtk.DrawingArea):
 
     def drawcell(self, cairo_ctx: cairo.Context, i: int, j: int) -> None:
         """Draw the cell at i, j, using the supplied graphics context."""
-        tile = self.showboard[i + j * XSIZE]
+        tile = self.showboard[i + j * self.bwidth]
 
         i = i * self.tilesize
         j = j * self.tilesize
@@ -171,18 +178,17 @@ class KCanvas(Gtk.DrawingArea):
 
     def draw_event(self, widget, cairo_ctx: cairo.Context) -> None:
         """draw handler; redraws the invalidated part of the display."""
-        x, y = 0, 0
-        width = widget.get_allocated_width()
-        height = widget.get_allocated_height()
-
+        # Only visit the tiles inside the area being redrawn, which matters
+        # on large boards when just a few tiles have changed.
+        x1, y1, x2, y2 = cairo_ctx.clip_extents()
         tilesize = self.tilesize
+        i1 = max(0, int(x1) // tilesize)
+        i2 = min(self.bwidth, -(-int(x2) // tilesize))
+        j1 = max(0, int(y1) // tilesize)
+        j2 = min(self.bheight, -(-int(y2) // tilesize))
         try:
-            for i in range(XSIZE):
-                if (i+1)*tilesize <= x or i*tilesize > x+width:
-                    continue
-                for j in range(YSIZE):
-                    if (j+1)*tilesize <= y or j*tilesize > y+height:
-                        continue
+            for i in range(i1, i2):
+                for j in range(j1, j2):
                     self.drawcell(cairo_ctx, i, j)
         except KeyError as e:
             md = Gtk.MessageDialog(
@@ -196,20 +202,20 @@ class KCanvas(Gtk.DrawingArea):
     def button_press_event(self, widget, event) -> None:
         """Handler for mouse button presses; just translates to game coords and passes on."""
         window, x, y, mods = event.window.get_pointer()
-        x = x // KCanvas.tilesize
-        y = y // KCanvas.tilesize
+        x = x // self.tilesize
+        y = y // self.tilesize
         self.bpress(event.button, x, y)
 
     def button_release_event(self, widget, event) -> None:
         """Handler for mouse button release; just translates to game coords and passes on."""
         window, x, y, mods = event.window.get_pointer()
-        x = x // KCanvas.tilesize
-        y = y // KCanvas.tilesize
+        x = x // self.tilesize
+        y = y // self.tilesize
         self.brelease(event.button, x, y)
 
     def mouse_motion_event(self, widget, event) -> None:
         """Handler for mouse movement; just translates to game coords and passes on."""
         window, x, y, mods = event.window.get_pointer()
-        x = x // KCanvas.tilesize
-        y = y // KCanvas.tilesize
+        x = x // self.tilesize
+        y = y // self.tilesize
         self.mouseto(x, y)
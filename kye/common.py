@@ -19,7 +19,8 @@
 """kye.common - Common utility functions and classes.
 Exposed constants:
 
-XSIZE, YSIZE - size of the game playing area.
+XSIZE, YSIZE - default size of the game playing area. A level can have a
+               different size, given by a size header (see read_board).
 
 VERSION - version number of this release of the game.
 
@@ -29,7 +30,7 @@ KYEPATHS - the list of paths that we will try for opening levels given on the
 import os.path
 from pathlib import Path
 import tarfile
-from typing import Dict, IO, Sequence, Union
+from typing import Dict, IO, List, Optional, Sequence, Tuple, Union
 
 XSIZE = 30
 YSIZE = 20
@@ -41,6 +42,47 @@ KYEPATHS = [Path(x) for x in ["levels",
                               "/usr/share/kye"]]
 
 
+SIZE_HEADER = "#size"
+
+
+def parse_size_header(line: str) -> Optional[Tuple[int, int]]:
+    """If line is a level size header ("#size WIDTH HEIGHT"), return (WIDTH, HEIGHT); otherwise None."""
+    if not line.startswith(SIZE_HEADER):
+        return None
+    try:
+        _, w, h = line.split()
+        width, height = int(w), int(h)
+    except ValueError:
+        return None
+    if width < 3 or height < 3:
+        return None
+    return width, height
+
+
+def size_header(width: int, height: int) -> str:
+    """Returns the size header line (without line ending) for a level of the given size."""
+    return "%s %d %d" % (SIZE_HEADER, width, height)
+
+
+def read_board(f: IO) -> Tuple[int, int, List[str]]:
+    """Reads the board of a level from f, just after its exit message line.
+
+    Levels are XSIZE by YSIZE unless the board starts with a size header line
+    giving another size; this is an extension to the original Kye format.
+    Returns (width, height, rows); rows are padded out to the full width."""
+    line = f.readline()
+    size = parse_size_header(line)
+    rows = []
+    if size is None:
+        width, height = XSIZE, YSIZE
+        rows.append(line.rstrip("\r\n").ljust(width))
+    else:
+        width, height = size
+    while len(rows) < height:
+        rows.append(f.readline().rstrip("\r\n").ljust(width))
+    return width, height, rows
+
+
 def tryopen(filename: Path, paths: Sequence[Path]) -> IO:
     """Returns a reading file handle for filename, searching through directories in the supplied paths."""
     try:
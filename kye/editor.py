@@ -27,7 +27,7 @@ import gi
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk
 
-from kye.common import KYEPATHS, tryopen
+from kye.common import findfile
 from kye.canvas import KCanvas
 from kye.palette import KPalette
 from kye.dialogs import (
@@ -38,6 +38,7 @@ from kye.dialogs import (
     kyeffilter,
 )
 from kye.leveledit import KLevelEdit
+from kye.levelset import KLevelSet
 
 ui_string = """<ui>
  <menubar name='KyeEditMenuBar'>
@@ -342,12 +343,13 @@ class KEditor(Gtk.Window):
     def do_open(self, fname: Path, template=0) -> bool:
         """Open a new level set to edit."""
         try:
-            gamefile = tryopen(fname, KYEPATHS)
-            self.g = KLevelEdit(gamefile,
+            levels = KLevelSet(findfile(fname))
+            self.g = KLevelEdit(levels,
                                 disp=self.canvas,
                                 newleveltemplate=self.__newlevel,
                                 setlevellist=self.setlevels,
                                 hintmenuitems=self.hintmenuitems)
+            levels.close()
             self.palette.set_target(self.g)
             if template == 0:
                 self.setfname(fname)
@@ -477,8 +479,9 @@ class KEditor(Gtk.Window):
         """Return an empty level, read from template.kye, as a start for designing a new level."""
         fname = "template.kye"
         try:
-            gamefile = tryopen(fname, KYEPATHS)
-            g = KLevelEdit(gamefile, disp=self.canvas, newleveltemplate=None)
+            levels = KLevelSet(findfile(fname))
+            g = KLevelEdit(levels, disp=self.canvas, newleveltemplate=None)
+            levels.close()
         except (IOError, OSError) as e:
             self.error_message("%s" % e)
             raise
@@ -0,0 +1,50 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""kye.events - the events that a KGame reports to its observers."""
+
+from enum import Enum
+
+
+class KEvent(Enum):
+    """Things that happen in a game, which can be subscribed to with KGame.subscribe.
+
+    Each observer is called with the arguments listed against the event."""
+
+    # (obj, x, y, tx, ty) - obj moved from (x, y) to (tx, ty).
+    MOVED = "moved"
+
+    # (obj, x, y) - obj was added to the game at (x, y).
+    SPAWNED = "spawned"
+
+    # (obj, x, y) - obj was taken out of the game at (x, y).
+    REMOVED = "removed"
+
+    # (diamonds,) - a diamond was collected; diamonds are still left.
+    DIAMOND = "diamond"
+
+    # (lives,) - the Kye died, and has lives lives left.
+    KYE_DIED = "kye died"
+
+    # () - the last diamond in the level has been collected.
+    LEVEL_COMPLETE = "level complete"
+
+    # (squares,) - at the end of a tick, the list of squares, as (x, y),
+    # whose image may have changed since the last REDRAW. The first
+    # REDRAW after subscribing covers the whole board.
+    REDRAW = "redraw"
@@ -154,6 +154,15 @@ class KFrame(Gtk.Window):
                                   padding=0)
         self.canvas.show()
 
+        # Timeline for seeking in recordings, shown only while playing one.
+        self.timeline = Gtk.Scale.new_with_range(Gtk.Orientation.HORIZONTAL,
+                                                 0, 1, 1)
+        self.timeline.set_digits(0)
+        self.timeline.set_can_focus(False)
+        self.timeline.connect("change-value", self.seek)
+        self.main_vbox.pack_start(self.timeline, expand=False, fill=True,
+                                  padding=0)
+
         # Status bar
         self.stbar = StatusBar(self.canvas.get_image("kye", tilesize=16))
         self.stbar.set_size_request(tilesize * kye.common.XSIZE, -1)
@@ -282,6 +291,25 @@ class KFrame(Gtk.Window):
         """Menu requested restart of the current level."""
         self.__app.restart()
 
+    def seek(self, scale, scroll, value):
+        """The user moved the timeline; jump to that point in the recording."""
+        self.__app.seek(int(value))
+        return False
+
+    def show_timeline(self, length):
+        """Show the timeline, for a recording of the given number of ticks."""
+        self.timeline.set_range(0, max(length, 1))
+        self.timeline.set_value(0)
+        self.timeline.show()
+
+    def hide_timeline(self):
+        """Hide the timeline, when not playing back a recording."""
+        self.timeline.hide()
+
+    def timeline_position(self, tick):
+        """Move the timeline to the given tick of the recording."""
+        self.timeline.set_value(tick)
+
     def doopen(self, filename):
         """Tell the game to open the given level set."""
         self.__app.open(filename)
@@ -300,9 +328,14 @@ class KFrame(Gtk.Window):
         if not self.ignore_sizing:
             ts = ra.get_current_value()
             self.canvas.settilesize(ts)
-            self.stbar.set_size_request(ts * kye.common.XSIZE, -1)
+            self.stbar.set_size_request(ts * self.canvas.bwidth, -1)
             self.settings["Size"] = ts
 
+    def set_board_size(self, width, height):
+        """Resize the game display for a board of the given size, in tiles."""
+        self.canvas.set_board_size(width, height)
+        self.stbar.set_size_request(self.canvas.tilesize * width, -1)
+
     def endleveldialog(self, nextlevel, endmsg):
         """Call when the level ends, to give the between-level messages."""
         self.canvas.brelease(1, 0, 0)
@@ -18,7 +18,9 @@
 
 """kye.game - implements the Kye game state and behaviour."""
 
-from typing import Any, Dict, IO, List, Optional, Tuple, Type, Sequence
+from operator import attrgetter
+from random import Random
+from typing import Any, Callable, Dict, IO, Iterable, List, Optional, Tuple, Type, Sequence, Union
 
 import kye.objects
 from kye.objects import (
@@ -34,10 +36,98 @@ from kye.objects import (
     Sentry,
     Shooter,
     Slider,
-    Thinker,
     Wall,
+    EMPTY,
+    WALL,
+    KYE,
+    DIAMOND,
+    ONEWAY,
+    MAGNET,
+    PUSHABLE,
+    EATABLE,
+    SWALLOWS,
+    LETHAL,
+    NCODES,
+    magnet_field_at,
 )
-from kye.common import XSIZE, YSIZE
+from kye.common import read_board
+from kye.events import KEvent
+from kye.levelset import KLevelSet
+from kye.scheduler import KScheduler
+
+# Width of the wall border kept around the board. No object probes further
+# than two squares from itself, so with this much padding lookups made on
+# behalf of objects never need bounds checks.
+PAD = 2
+
+# The object which occupies every cell of the border.
+BORDER = Wall(5)
+
+# The state hash of a game repeats the tick count modulo this: the lowest
+# common multiple of the think frequencies of all objects.
+TICK_PHASE = 420
+
+MASK64 = (1 << 64) - 1
+
+
+def _mix64(z: int) -> int:
+    """Return z mixed up by the splitmix64 finaliser, as a 64-bit integer."""
+    z = z * 0x9E3779B97F4A7C15 & MASK64
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB & MASK64
+    return z ^ (z >> 31)
+
+
+def zobrist_key(pos: int, code: int, state: int) -> int:
+    """Return the 64-bit hash key for an object of type code, with the given zstate, at board index pos.
+
+    These take the place of a table of random numbers in Zobrist hashing:
+    object states are open-ended, so keys are made by mixing up the
+    features with the splitmix64 finaliser instead of being looked up. The
+    board index takes the low 32 bits, which is room for any board that
+    fits in memory."""
+    return _mix64((state * (NCODES + 1) + code) << 32 | pos)
+
+
+def _ints_key(values: Iterable[int]) -> int:
+    """Return a 64-bit hash of a sequence of integers of up to 64 bits each.
+
+    Unlike hash() of a tuple, this is the same on every machine and
+    version of Python."""
+    z = 0
+    for v in values:
+        z = _mix64((z ^ v) + 1)
+    return z
+
+
+def _layout(cls: Type[kye.objects.Base]) -> Tuple[Callable[[kye.objects.Base], tuple], Tuple[str, ...], Tuple[int, ...]]:
+    """Return how KGame.snapshot saves objects of class cls.
+
+    That is: a function returning the values of the slots which make up the
+    state of such an object, the names of those slots, and the positions
+    among them of the slots which hold other objects."""
+    layout = _layouts.get(cls)
+    if layout is None:
+        names = []
+        for c in reversed(cls.__mro__):
+            for name in c.__dict__.get('__slots__', ()):
+                if name.startswith('__'):
+                    name = '_' + c.__name__.lstrip('_') + name
+                if name not in ('sched_bucket', 'sched_index'):
+                    names.append(name)
+        refs = tuple(i for i, name in enumerate(names) if name in cls.refs)
+        layout = _layouts[cls] = (attrgetter(*names), tuple(names), refs)
+    return layout
+
+
+_layouts: Dict[type, Tuple[Callable[[kye.objects.Base], tuple], Tuple[str, ...], Tuple[int, ...]]] = {}
+
+
+# Active objects are scheduled in groups by the 2**CHUNK_SHIFT square chunk of
+# the board they started in, so that on large boards the game does not visit
+# parts of the board where everything is asleep. A standard 30x20 level is a
+# single chunk.
+CHUNK_SHIFT = 5
 
 
 class KGame:
@@ -95,53 +185,161 @@ class KGame:
         'F': (Shooter,   (True,)),
         }
 
-    def __init__(self, f: IO, want_level: str, movesource, rng) -> None:
-        levels = f.readline()
-        if levels == "":
-            raise KGameFormatError
+    def __init__(self, f: Union[IO, KLevelSet], want_level: str, movesource, rng,
+                 sleep: bool = True, hashing: bool = False) -> None:
+        """Load level want_level (or the first level, if "") from the level set f.
+
+        f is either a level set file, which is read through to the level
+        wanted, or a KLevelSet, which goes straight to it. A KLevelSet also
+        keeps each level as it is at the start (see KLevelTemplate), so that
+        later games of the same level are copied from that rather than
+        loaded again. movesource supplies the Kye's moves and rng is the
+        game's random number source (a KRandom, or a random.Random when
+        replaying old recordings). If sleep is true, objects that are
+        stuck are put to sleep until something near them changes (see
+        dotick); this does not change how the game plays, only how much work
+        each tick does. If hashing is true, a hash of the game state is kept
+        (see state_hash)."""
+        self.running = 1
+        self.random = rng
 
-        levels.strip()
+        # Random numbers for animations, which make no difference to the
+        # game, so are kept apart from rng (and out of snapshots). Each game
+        # has its own, so that games in different threads do not share it.
+        self.animation = Random(0)
+        self.ms = movesource
 
-        self.levelnum = 0
-        while 1:
-            levelname = f.readline()
-            if levelname == "" and self.levelnum == 0:
+        if isinstance(f, KLevelSet):
+            if len(f) == 0:
+                raise KGameFormatError
+            levelnum = f.number(want_level)
+            template = f.templates.get(levelnum)
+            if template is None:
+                # Templates carry a state hash, for any game made from them
+                # which wants one.
+                (self.levelnum, self.thislev, self.hint, self.exitmsg,
+                 width, height, board, self.nextlevel) = f.level(levelnum)
+                self.__build(width, height,
+                             [board[y*width:(y+1)*width] for y in range(height)],
+                             sleep, True)
+                f.templates[levelnum] = self.__template()
+            else:
+                self.__copy(template, sleep)
+            # Without hashing, the hash is left to go stale from here on;
+            # snapshots of the game leave it out.
+            self.hashing = hashing
+        else:
+            levels = f.readline()
+            if levels == "":
                 raise KGameFormatError
-            levelname = levelname.strip().upper()
-            self.levelnum = self.levelnum+1
-            if levelname == "" or levelname == want_level or "" == want_level:
-                break
-            # Skip level for this level.
-            for i in range(22):
-                f.readline()
-
-        if (levelname != want_level and want_level != ""):
-            raise KeyError("level %s not found" % want_level)
-
-        self.thislev = levelname
-        self.hint = f.readline().strip()
-        self.exitmsg = f.readline().strip()
-        board: List[Optional[kye.objects.Base]] = []
-        self.invalidate = []
-        self.magnet_count = []
 
-        for i in range(XSIZE*YSIZE):
-            board.append(None)
-            self.invalidate.append(1)
-            self.magnet_count.append(0)
+            levels.strip()
+
+            self.levelnum = 0
+            while 1:
+                levelname = f.readline()
+                if levelname == "" and self.levelnum == 0:
+                    raise KGameFormatError
+                levelname = levelname.strip().upper()
+                self.levelnum = self.levelnum+1
+                if levelname == "" or levelname == want_level or "" == want_level:
+                    break
+                # Skip this level.
+                f.readline()
+                f.readline()
+                read_board(f)
+
+            if (levelname != want_level and want_level != ""):
+                raise KeyError("level %s not found" % want_level)
+
+            self.__load(f, levelname, sleep, hashing)
+
+    def __setup(self, width: int, height: int, sleep: bool, hashing: bool) -> None:
+        """Set up an empty board of the given size."""
+        self.width, self.height = width, height
+
+        # The board is stored with a border of walls, PAD cells wide. Each
+        # cell has an entry in board (the object there, if any) and in cells
+        # (the type code of that object - see kye.objects). Cell (x, y) is at
+        # index stride*y + x + origin.
+        self.stride = stride = width + 2*PAD
+        self.origin = PAD*stride + PAD
+        size = stride * (height + 2*PAD)
+        board: List[Optional[kye.objects.Base]] = [BORDER] * size
+        self.cells = bytearray([WALL]) * size
+        self.rounds = bytearray(size)  # roundness of the object in each cell
+
+        for y in range(height):
+            start = stride*y + self.origin
+            board[start:start+width] = [None] * width
+            self.cells[start:start+width] = bytes(width)
+
+        # Observers of the game, by event (see subscribe). While there are
+        # none, the game does no work at all to report what happens.
+        self.__observers: Dict[KEvent, List[Callable[..., Any]]] = {
+            e: [] for e in KEvent}
+        self.observed = False
+
+        # Squares which need redrawing, kept only while REDRAW is observed:
+        # dirtylist holds each board index at most once, with dirty set to 1
+        # at the indices which are in it.
+        self.tracking = False
+        self.dirty = bytearray(size)
+        self.dirtylist: List[int] = []
+        self.chunkstride = ((width - 1) >> CHUNK_SHIFT) + 1
+
+        # Magnets: magnet_field holds how magnets act on an object in each
+        # square (see kye.objects.magnet_field_at), kept up to date as the
+        # board changes. A square's field depends on the squares up to two
+        # away along each axis; magnet_near counts, for each square, the
+        # magnets for which a change there can alter the field next to it.
+        self.magnet_field = bytearray(size)
+        self.magnet_near = bytearray(size)
+        self.__magnet_reach = (-2, -1, 1, 2, -2*stride, -stride, stride, 2*stride)
+        self.__neighbours = (-1, 1, -stride, stride)
+        self.__magnet_near = tuple(sorted(set(
+            r + n for r in self.__magnet_reach for n in self.__neighbours)))
+
+        self.sleeping = bytearray(size)  # 1 where the object is asleep
+        self.nasleep = 0
+        self.allow_sleep = sleep
+
+        # Zobrist hash of everything on the board, if wanted: the XOR of the
+        # zkey of every object, which each object keeps up to date.
+        self.hashing = hashing
+        self.zhash = 0
 
         self.board = board
-        self.loc: Dict[kye.objects.Base, Tuple[int, int]] = {}
-        self.thinkers: List[Tuple[int, kye.objects.Base]] = []
+        self.thinkers = KScheduler()
         self.diamonds = 0
-        self.thekye = None
+        self.thekye: Optional[Kye] = None
         self.kye: Optional[Kye]
         # TODO: self.kye and self.thekye, wtf?
 
-        for y in range(YSIZE):
-            l = f.readline()
-            for x in range(XSIZE):
-                edge = (x == 0 or y == 0 or x == XSIZE-1 or y == YSIZE-1)
+        self.__restored: Optional[Tuple[tuple, List[Any]]] = None
+
+    def __load(self, f: IO, levelname: str, sleep: bool, hashing: bool) -> None:
+        """Load the level called levelname from f, which is just after the level's name."""
+        self.thislev = levelname
+        self.hint = f.readline().strip()
+        self.exitmsg = f.readline().strip()
+        width, height, rows = read_board(f)
+        self.nextlevel = f.readline().strip()
+        if self.nextlevel == "\x1a":
+            self.nextlevel = ""
+        f.close()
+        self.__build(width, height, rows, sleep, hashing)
+
+    def __build(self, width: int, height: int, rows: List[str], sleep: bool,
+                hashing: bool) -> None:
+        """Set up the board from rows, the lines of the level's board."""
+        self.__setup(width, height, sleep, hashing)
+        board = self.board
+
+        for y in range(height):
+            l = rows[y]
+            for x in range(width):
+                edge = (x == 0 or y == 0 or x == width-1 or y == height-1)
                 c = l[x]
 
                 # Blank means empty cell - but override at the edge
@@ -162,9 +360,15 @@ class KGame:
                     # Add to the grid
                     self.add_at(x, y, cc)
 
+                    # Animated objects start at different points in
+                    # their animations.
+                    if isinstance(cc, (Diamond, Monster)):
+                        cc.start_animation(self.animation)
+
                     # Objects where location matters
                     if isinstance(cc, Shooter):
                         cc.setang(x % 4)
+                        self.rekey(cc)
                     if isinstance(cc, Kye):
                         self.kyestart = (x, y)
                         self.thekye = cc
@@ -178,16 +382,37 @@ class KGame:
             self.kyestart = (3, 3)
             self.add_at(3, 3, cc)
 
-        self.nextlevel = f.readline().strip()
-        if self.nextlevel == "\x1a":
-            self.nextlevel = ""
-        f.close()
-
         self.animate_frame = 0
-        self.running = 1
         self.tics = 0
-        self.random = rng
-        self.ms = movesource
+
+        # Walls never change or leave the board, so snapshots leave them out:
+        # the walls of the level, with the squares where anything else can
+        # ever be.
+        self.__walls = tuple([o if o is not None and o.code == WALL else None
+                              for o in board])
+        self.__floor = tuple([pos for pos, o in enumerate(self.__walls)
+                              if o is None])
+
+    def __template(self) -> "KLevelTemplate":
+        """Return a template of this game, which must be newly loaded and keeping a state hash."""
+        return KLevelTemplate(self.levelnum, self.thislev, self.hint,
+                              self.exitmsg, self.nextlevel, self.width,
+                              self.height, self.kyestart, self.__walls,
+                              self.__floor, self.snapshot())
+
+    def __copy(self, template: "KLevelTemplate", sleep: bool) -> None:
+        """Set this game up as a copy of template."""
+        t = template
+        self.levelnum = t.levelnum
+        self.thislev = t.thislev
+        self.hint = t.hint
+        self.exitmsg = t.exitmsg
+        self.nextlevel = t.nextlevel
+        self.kyestart = t.kyestart
+        self.__setup(t.width, t.height, sleep, True)
+        self.__walls = t.walls
+        self.__floor = t.floor
+        self.__set_state(t.state)
 
     def nextrand(self, n: int) -> int:
         """Return a random number from 0..n-1 from this games random number source."""
@@ -195,13 +420,18 @@ class KGame:
 
     def get_at(self, i: int, j: int) -> Optional[kye.objects.Base]:
         """Return the content of tile (i, j). Caller must ensure that (i, j) is inside the game board."""
-        return self.board[XSIZE*j + i]
+        return self.board[self.stride*j + i + self.origin]
 
     def get_atB(self, i: int, j: int) -> Optional[kye.objects.Base]:
-        """Returns the content of tile (i, j), or a Wall if (i, j) is outside of the board."""
-        if i < 0 or i >= XSIZE or j < 0 or j >= YSIZE:
-            return Wall(5)
-        return self.get_at(i, j)
+        """Returns the content of tile (i, j), or a Wall if (i, j) is just outside of the board.
+
+        (i, j) may be up to PAD squares outside the board, which is as far as
+        any object ever looks."""
+        return self.board[self.stride*j + i + self.origin]
+
+    def in_board(self, i: int, j: int) -> bool:
+        """Returns true iff (i, j) is inside the game board."""
+        return 0 <= i < self.width and 0 <= j < self.height
 
     def get_tile(self, i: int, j: int) -> str:
         """Return the image to show for the tile at (i, j)."""
@@ -211,102 +441,411 @@ class KGame:
         return c.image(self.animate_frame)
 
     def get_location(self, obj: kye.objects.Base) -> Tuple[int, int]:
-        """Return the location in the game of the given game object."""
-        return self.loc[obj]
-
-    def magnet_range(self, x, y, d):
-        """Update the magnet effect table to allow for the addition (if d=1) or removal (if d=-1) of a magnet at (x, y)."""
-        pos = XSIZE*y + x
-        maxp = XSIZE*YSIZE
-        if pos >= 2:
-            self.magnet_count[pos - 2] = self.magnet_count[pos - 2] + d
-        if pos >= 1:
-            self.magnet_count[pos - 1] = self.magnet_count[pos - 1] + d
-        if pos + 1 < maxp:
-            self.magnet_count[pos + 1] = self.magnet_count[pos + 1] + d
-        if pos + 2 < maxp:
-            self.magnet_count[pos + 2] = self.magnet_count[pos + 2] + d
-        if pos >= 2*XSIZE:
-            self.magnet_count[pos - 2*XSIZE] = self.magnet_count[pos - 2*XSIZE] + d
-        if pos >= 1*XSIZE:
-            self.magnet_count[pos - 1*XSIZE] = self.magnet_count[pos - 1*XSIZE] + d
-        if pos + 2*XSIZE < maxp:
-            self.magnet_count[pos + 2*XSIZE] = self.magnet_count[pos + 2*XSIZE] + d
-        if pos + 1*XSIZE < maxp:
-            self.magnet_count[pos + 1*XSIZE] = self.magnet_count[pos + 1*XSIZE] + d
+        """Return the location in the game of the given game object.
+
+        Raises KeyError if the object is not in the game."""
+        if obj is None or obj.x < 0:
+            raise KeyError(obj)
+        return obj.x, obj.y
+
+    def magnet_range(self, pos, d):
+        """Update the magnet tables to allow for the addition (if d=1) or removal (if d=-1) of a magnet at board index pos."""
+        near = self.magnet_near
+        for p in self.__magnet_near:
+            near[pos + p] += d
+        for p in self.__magnet_reach:
+            self.refield(pos + p)
+
+    def refield(self, pos):
+        """Recompute the magnet field at board index pos."""
+        if self.board[pos] is not BORDER:
+            self.magnet_field[pos] = magnet_field_at(self, pos)
+
+    def refield_around(self, pos):
+        """Recompute the magnet field next to board index pos, after the square there changes."""
+        for p in self.__neighbours:
+            self.refield(pos + p)
 
     def add_at(self, x: int, y: int, obj: kye.objects.Base) -> None:
         """Add the given object to the game at (x, y)."""
-        pos = XSIZE*y + x
+        pos = self.stride*y + x + self.origin
+        code = obj.code
         self.board[pos] = obj
-        self.invalidate[pos] = 1
-
-        # Add to the location map, add active objects to the thinkers list.
-        self.loc[obj] = (x, y)
+        self.cells[pos] = code
+        self.rounds[pos] = obj.roundness()
+        if self.nasleep:
+            self.wake(pos)
+
+        # Record the location in the object, add active objects to the thinkers list.
+        obj.x = x
+        obj.y = y
+        if self.hashing:
+            obj.zkey = zobrist_key(pos, code, obj.zstate())
+            self.zhash ^= obj.zkey
         f = obj.freq()
         if f > 0:
-            self.thinkers.append((f, obj))
+            self.thinkers.add(f, obj, (y >> CHUNK_SHIFT)*self.chunkstride + (x >> CHUNK_SHIFT))
 
         # Other object-type-specific tracking updates.
         if isinstance(obj, Kye):
             self.kye = obj
-        if isinstance(obj, Diamond):
+        elif code == DIAMOND:
             self.diamonds = self.diamonds+1
-        if isinstance(obj, Magnet):
-            self.magnet_range(x, y, 1)
+        elif code == MAGNET:
+            self.magnet_range(pos, 1)
+        if self.magnet_near[pos]:
+            self.refield_around(pos)
+
+        # Tell anyone watching.
+        if self.observed:
+            self.mark_dirty(pos)
+            self.emit(KEvent.SPAWNED, obj, x, y)
 
     def remove_at(self, x: int, y: int) -> None:
         """Remove the object at (x, y) from the game."""
         # Get the object and remove from the board.
-        pos = XSIZE*y + x
+        pos = self.stride*y + x + self.origin
+        if self.nasleep:
+            self.wake(pos)
         obj = self.board[pos]
+        code = self.cells[pos]
         self.board[pos] = None
+        self.cells[pos] = EMPTY
+        self.rounds[pos] = 0
 
         # Cause display update.
-        self.invalidate[pos] = 1
+        if self.observed:
+            self.mark_dirty(pos)
 
         # If this was an active object, remove from the active list.
-        # And remove from the object->location map.
+        # And mark the object as no longer being on the board.
         if obj is None:
             return
-        f = obj.freq()
-        if f > 0:
-            self.thinkers.remove((f, obj))
-        del self.loc[obj]
+        if obj.freq() > 0:
+            self.thinkers.remove(obj)
+        obj.x = -1
+        if self.hashing:
+            self.zhash ^= obj.zkey
 
         # Other object-type-specific tracking updates.
-        if isinstance(obj, Kye):
+        if code == KYE:
             self.kye = None
-        if isinstance(obj, Diamond):
+        elif code == DIAMOND:
             self.diamonds = self.diamonds-1
-        if isinstance(obj, Magnet):
-            self.magnet_range(x, y, -1)
+        elif code == MAGNET:
+            self.magnet_range(pos, -1)
+        if self.magnet_near[pos]:
+            self.refield_around(pos)
+
+        # Tell anyone watching.
+        if self.observed:
+            self.emit(KEvent.REMOVED, obj, x, y)
+            if code == DIAMOND:
+                self.emit(KEvent.DIAMOND, self.diamonds)
+                if self.diamonds == 0:
+                    self.emit(KEvent.LEVEL_COMPLETE)
 
     def move_object(self, x, y, tx, ty):
         """Move the object at (x, y) to (tx, ty)."""
         # Get it and move it.
-        pos_f = XSIZE*y + x
-        pos_t = XSIZE*ty + tx
-        obj = self.board[pos_f]
-        self.board[pos_f] = None
-        self.board[pos_t] = obj
-
-        # Cause display updates.
-        self.invalidate[pos_f] = 1
-        self.invalidate[pos_t] = 1
-
-        # Update object -> location map
-        self.loc[obj] = (tx, ty)
+        stride = self.stride
+        pos_f = stride*y + x + self.origin
+        pos_t = stride*ty + tx + self.origin
+        if self.nasleep:
+            self.wake(pos_f)
+            self.wake(pos_t)
+        board = self.board
+        cells = self.cells
+        obj = board[pos_f]
+        code = cells[pos_f]
+        board[pos_f] = None
+        board[pos_t] = obj
+        cells[pos_f] = EMPTY
+        cells[pos_t] = code
+        rounds = self.rounds
+        rounds[pos_t] = rounds[pos_f]
+        rounds[pos_f] = 0
+
+        # Update the object's own idea of where it is.
+        obj.x = tx
+        obj.y = ty
+        if self.hashing:
+            self.rekey(obj)
 
         # And other object-type-specific tracing updates.
-        if isinstance(obj, Magnet):
-            self.magnet_range(x,  y, -1)
-            self.magnet_range(tx, ty,  1)
+        if code == MAGNET:
+            self.magnet_range(pos_f, -1)
+            self.magnet_range(pos_t,  1)
+        near = self.magnet_near
+        if near[pos_f]:
+            self.refield_around(pos_f)
+        if near[pos_t]:
+            self.refield_around(pos_t)
+
+        # Cause display updates, and tell anyone watching.
+        if self.observed:
+            self.mark_dirty(pos_f)
+            self.mark_dirty(pos_t)
+            self.emit(KEvent.MOVED, obj, x, y, tx, ty)
 
     def invalidate_me(self, o):
         """Tell the game that an object's image has changed."""
-        x, y = self.get_location(o)
-        self.invalidate[XSIZE*y + x] = 1
+        pos = self.stride*o.y + o.x + self.origin
+        if self.observed:
+            self.mark_dirty(pos)
+        if self.nasleep:
+            self.wake(pos)
+
+    # State hashing
+
+    def rekey(self, obj: kye.objects.Base) -> None:
+        """Update the state hash for a change in the state (see Base.zstate) or location of obj, which is on the board."""
+        if self.hashing:
+            k = zobrist_key(self.stride*obj.y + obj.x + self.origin,
+                            obj.code, obj.zstate())
+            self.zhash ^= obj.zkey ^ k
+            obj.zkey = k
+
+    def __rehash(self) -> None:
+        """Work out the state hash, and every object's part in it, afresh."""
+        zhash = 0
+        for pos, obj in enumerate(self.board):
+            if obj is not None and obj is not BORDER:
+                obj.zkey = zobrist_key(pos, obj.code, obj.zstate())
+                zhash ^= obj.zkey
+        self.zhash = zhash
+
+    def state_hash(self) -> int:
+        """Return a 64-bit hash of the state of the game.
+
+        This covers every object on the board and its state, the tick count
+        (modulo TICK_PHASE) and the random number generator. It does not
+        cover the order in which objects think, which follows the order
+        they were created. The game must have been created with hashing on.
+        """
+        if not self.hashing:
+            raise RuntimeError("state hashing is not enabled for this game")
+        h = self.zhash ^ zobrist_key(0, NCODES, self.tics % TICK_PHASE)
+        state = self.random.getstate()
+        if isinstance(self.random, Random):
+            # Only the Mersenne Twister words (and its place in them): the
+            # rest is not integers.
+            state = state[1]
+        return h ^ _ints_key(state)
+
+    # Snapshots
+
+    def snapshot(self) -> tuple:
+        """Return the state of the game, as an immutable value which restore() can later bring the game back to.
+
+        This holds every object in the game except the walls, with all of
+        its slots (so the frames of animations too), the order in which they
+        think, the tick count, the state hash if the game keeps one, and the
+        state of the random number generator, so a restored game plays on
+        exactly as this one would. It refers to none of the game's objects,
+        and may be restored any number of times. (The game's generator for
+        animations is not saved: it is only used while loading the level.)"""
+        # Every object is saved as its class and the values of its slots,
+        # with any links to other objects replaced by their place in the
+        # list of objects.
+        board = self.board
+        objects = list(filter(None, map(board.__getitem__, self.__floor)))
+        index = {id(o): i for i, o in enumerate(objects)}
+        objs: List[Any] = []
+        for o in objects:
+            cls = type(o)
+            get, names, refs = _layouts.get(cls) or _layout(cls)
+            objs.append((cls, get(o)))
+
+        def link(o: Optional[kye.objects.Base]) -> int:
+            if o is None:
+                return -1
+            i = index.get(id(o))
+            if i is None:
+                # Not on the board: save it too.
+                i = index[id(o)] = len(objects)
+                objects.append(o)
+                cls = type(o)
+                objs.append((cls, _layout(cls)[0](o)))
+            return i
+
+        # Before links between objects are replaced, as the Kye may be off
+        # the board (and the objects it links to need replacing too).
+        kyeref = link(self.kye)
+        thekyeref = link(self.thekye)
+        i = 0
+        while i < len(objs):
+            cls, values = objs[i]
+            refs = _layout(cls)[2]
+            if refs:
+                v = list(values)
+                for r in refs:
+                    v[r] = link(v[r])
+                objs[i] = (cls, tuple(v))
+            i += 1
+
+        order = self.thinkers.save(lambda o: index[id(o)])
+        return (self.thislev, self.width, self.height, tuple(objs), order,
+                kyeref, thekyeref, bytes(self.cells),
+                bytes(self.rounds), bytes(self.magnet_field),
+                bytes(self.magnet_near), bytes(self.sleeping), self.nasleep,
+                self.diamonds, self.tics, self.animate_frame,
+                self.zhash if self.hashing else None,
+                self.random.getstate())
+
+    def restore(self, state: tuple) -> None:
+        """Return the game to a state returned by snapshot() on this game, or another game of the same level."""
+        self.__set_state(state)
+        self.random.setstate(state[-1])
+
+        # Anyone watching needs to see the whole board again.
+        if self.tracking:
+            self.__mark_all()
+        if self.observed:
+            self.emit(KEvent.DIAMOND, self.diamonds)
+
+    def __set_state(self, state: tuple) -> None:
+        """Restore everything but the random number generator from state."""
+        (level, width, height, objs, order, kye, thekye, cells, rounds, field,
+         near, sleeping, nasleep, diamonds, tics, animate_frame, zhash,
+         rstate) = state
+        if (level, width, height) != (self.thislev, self.width, self.height):
+            raise ValueError("snapshot is of a different level")
+
+        # When the same state is restored again, which is what searches
+        # do, most objects are just as they were restored last time, and
+        # are kept rather than made again.
+        made: List[Any]
+        if self.__restored is not None and self.__restored[0] is objs:
+            made = self.__restored[1]
+        else:
+            made = [None] * len(objs)
+        linked = []
+        for i, (cls, values) in enumerate(objs):
+            get, names, refs = _layouts.get(cls) or _layout(cls)
+            o = made[i]
+            if o is None or refs or get(o) != values:
+                made[i] = o = cls.__new__(cls)
+                for name, v in zip(names, values):
+                    setattr(o, name, v)
+                if refs:
+                    linked.append(o)
+        self.__restored = (objs, made)
+
+        # Then put back the links between objects.
+        for o in linked:
+            get, names, refs = _layout(type(o))
+            for r in refs:
+                i = getattr(o, names[r])
+                setattr(o, names[r], made[i] if i >= 0 else None)
+
+        stride = self.stride
+        origin = self.origin
+        board = list(self.__walls)
+        for o in made:
+            if o.x >= 0:
+                board[stride*o.y + o.x + origin] = o
+        self.board = board
+        self.cells = bytearray(cells)
+        self.rounds = bytearray(rounds)
+        self.magnet_field = bytearray(field)
+        self.magnet_near = bytearray(near)
+
+        self.thinkers = thinkers = KScheduler()
+        thinkers.load(order, made)
+        self.sleeping = bytearray(sleeping)
+        self.nasleep = nasleep
+        if nasleep:
+            pos = self.sleeping.find(1)
+            while pos >= 0:
+                obj = board[pos]
+                assert obj is not None  # for mypy
+                thinkers.sleep(obj)
+                pos = self.sleeping.find(1, pos+1)
+
+        self.kye = made[kye] if kye >= 0 else None
+        self.thekye = made[thekye] if thekye >= 0 else None
+        self.diamonds = diamonds
+        self.tics = tics
+        self.animate_frame = animate_frame
+        if zhash is not None:
+            self.zhash = zhash
+        elif self.hashing:
+            # The state is of a game which was not keeping the hash.
+            self.__rehash()
+
+    # Observers
+
+    def subscribe(self, event: KEvent, callback: Callable[..., Any]) -> None:
+        """Have callback called whenever event happens in the game (see kye.events for the arguments it is given)."""
+        self.__observers[event].append(callback)
+        if event == KEvent.REDRAW and not self.tracking:
+            # A new display needs to draw the whole board.
+            self.__mark_all()
+        self.__observers_changed()
+
+    def unsubscribe(self, event: KEvent, callback: Callable[..., Any]) -> None:
+        """Stop calling callback for event."""
+        self.__observers[event].remove(callback)
+        self.__observers_changed()
+
+    def __observers_changed(self) -> None:
+        self.observed = any(self.__observers.values())
+        self.tracking = len(self.__observers[KEvent.REDRAW]) > 0
+        if not self.tracking:
+            for pos in self.dirtylist:
+                self.dirty[pos] = 0
+            self.dirtylist.clear()
+
+    def emit(self, event: KEvent, *args) -> None:
+        """Call the observers of event with the given arguments."""
+        for callback in self.__observers[event]:
+            callback(*args)
+
+    def __mark_all(self) -> None:
+        """Note that every square of the board needs redrawing."""
+        stride = self.stride
+        self.dirtylist.clear()
+        for y in range(self.height):
+            start = stride*y + self.origin
+            self.dirty[start:start+self.width] = b"\x01" * self.width
+            self.dirtylist.extend(range(start, start+self.width))
+
+    def mark_dirty(self, pos: int) -> None:
+        """Note that the square at board index pos needs redrawing."""
+        if self.tracking and not self.dirty[pos]:
+            self.dirty[pos] = 1
+            self.dirtylist.append(pos)
+
+    def __redraw(self) -> None:
+        """Send the squares which need redrawing to the REDRAW observers."""
+        dirty = self.dirty
+        stride = self.stride
+        origin = self.origin
+        squares = []
+        for pos in self.dirtylist:
+            dirty[pos] = 0
+            y, x = divmod(pos - origin, stride)
+            squares.append((x, y))
+        self.dirtylist.clear()
+        self.emit(KEvent.REDRAW, squares)
+
+    def wake(self, pos):
+        """Wake every sleeping object within two squares of board index pos.
+
+        Called whenever the content or state of the square at pos changes."""
+        sleeping = self.sleeping
+        stride = self.stride
+        p = pos - 2*stride - 2
+        end = pos + 2*stride - 2
+        while p <= end:
+            i = sleeping.find(1, p, p+5)
+            while i >= 0:
+                sleeping[i] = 0
+                self.nasleep -= 1
+                self.thinkers.wake(self.board[i])
+                i = sleeping.find(1, i+1, p+5)
+            p += stride
 
     def push_object(self, x, y, dx, dy):
         """Push object at (x,y) in direction (dx, dy).
@@ -317,27 +856,29 @@ class KGame:
         """
 
         # Get the object, and the square that it would be pushed to.
-        tx, ty = x+dx, y+dy
-        obj = self.get_at(x, y)
+        stride = self.stride
+        pos = stride*y + x + self.origin
+        cells = self.cells
 
         # Only active objects can be moved.
-        if not isinstance(obj, Thinker):
+        if not PUSHABLE[cells[pos]]:
             return False
 
         # To push diagonally, need the two side squares clear
         if dx != 0 and dy != 0:
-            if self.get_atB(x, ty) is not None or self.get_atB(tx, y) is not None:
+            if cells[pos + stride*dy] != EMPTY or cells[pos + dx] != EMPTY:
                 return False
 
         # If target square is empty, the object moves.
-        t = self.get_atB(tx, ty)
-        if t is None:
-            self.move_object(x, y, tx, ty)
+        tpos = pos + stride*dy + dx
+        t = cells[tpos]
+        if t == EMPTY:
+            self.move_object(x, y, x+dx, y+dy)
             return True
 
         # If moving into a black hole, destroy the object and update black hole state.
-        elif isinstance(t, BlackHole):
-            if t.swallow(self):
+        elif SWALLOWS[t]:
+            if self.board[tpos].swallow(self):
                 self.remove_at(x, y)
                 return True
 
@@ -346,7 +887,7 @@ class KGame:
 
     def dokye(self, k):
         """Do the Kye's move."""
-        x, y = self.get_location(k)
+        x, y = k.x, k.y
 
         # Get the move for the Kye from the input source (human or recording).
         m = self.ms.get_move()
@@ -370,37 +911,40 @@ class KGame:
             else:
                 dy = 0
         else:
-            dx, dy = m[1:]
+            dx, dy = m[1], m[2]
 
         if dx != 0 and dy != 0:
             # Diagonal move. If either square either side of the diagnoal is
             # occupied, we cannot move diagonally.
-            xt, yt = self.get_atB(x+dx, y), self.get_atB(x, y+dy)
+            xt = self.cells[self.stride*y + x+dx + self.origin] != EMPTY
+            yt = self.cells[self.stride*(y+dy) + x + self.origin] != EMPTY
             if m[0] == 'abs':
                 # Fail if both blocked
-                if xt is not None and yt is not None:
+                if xt and yt:
                     return
 
                 # But, if this is an absolute move, we could still move into the
                 # other square beside the diagonal if only one is blocking.
                 # Change the relative move that we are attempting accordingly.
-                if xt is not None:
+                if xt:
                     dx = 0
-                if yt is not None:
+                if yt:
                     dy = 0
             else:
                 # Fail if even one blocked if he definitely wanted diagonal
-                if xt is not None or yt is not None:
+                if xt or yt:
                     return
 
         # Okay, get what is in the way of this move, if anything.
-        t = self.get_atB(x+dx, y+dy)
+        tpos = self.stride*(y+dy) + x+dx + self.origin
+        t = self.board[tpos]
+        tc = self.cells[tpos]
 
         # Special actions for certain targets.
-        if isinstance(t, Edible):
+        if EATABLE[tc]:
             self.remove_at(x+dx, y+dy)
             t = None
-        if isinstance(t, BlackHole):
+        if SWALLOWS[tc]:
             if t.swallow(self, animate=False):
                 self.kill_kye(k)
         else:
@@ -410,7 +954,7 @@ class KGame:
             # "hide" the one-way object in the Kye object, and replace it on
             # the board when the Kye next moves.
             new_under = None
-            if isinstance(t, OneWay) and t.allow_move(dx, dy):
+            if tc == ONEWAY and t.allow_move(dx, dy):
                 # Remove the one-way and will store in the Kye.
                 self.remove_at(x+dx, y+dy)
                 new_under, t = t, None
@@ -427,6 +971,7 @@ class KGame:
                 if k.under is not None:
                     self.add_at(x, y, k.under)
                 k.under = new_under
+                self.rekey(k)
 
     def find_kye(self):
         """Return the location of the Kye."""
@@ -434,11 +979,13 @@ class KGame:
 
     def kill_kye(self, k):
         """Call if Kye dies; start death animation and update lives."""
-        x, y = self.get_location(k)
+        x, y = k.x, k.y
         k.lives = k.lives - 1
         ghost = KyeGhost(k)
         self.remove_at(x, y)
         self.add_at(x, y, ghost)
+        if self.observed:
+            self.emit(KEvent.KYE_DIED, k.lives)
 
     def respawn_kye(self, k):
         """When death animation ends, this is called to create the new Kye."""
@@ -456,7 +1003,7 @@ class KGame:
                 else:
                     x = self.kyestart[0] + self.random.randint(-r, r)
                     y = self.kyestart[1] + self.random.randint(-r, r)
-                if self.get_atB(x, y) is None:
+                if self.in_board(x, y) and self.get_at(x, y) is None:
                     self.add_at(x, y, k)
                     return k
 
@@ -465,11 +1012,14 @@ class KGame:
 
     def check_monsters(self):
         """Check whether the Kye has touched a monster."""
-        x, y = self.get_location(self.kye)
-        if (isinstance(self.get_atB(x+1, y), Monster)
-                or isinstance(self.get_atB(x-1, y), Monster)
-                or isinstance(self.get_atB(x, y+1), Monster)
-                or isinstance(self.get_atB(x, y-1), Monster)):
+        x, y = self.kye.x, self.kye.y
+        cells = self.cells
+        stride = self.stride
+        pos = stride*y + x + self.origin
+        if (LETHAL[cells[pos+1]]
+                or LETHAL[cells[pos-1]]
+                or LETHAL[cells[pos+stride]]
+                or LETHAL[cells[pos-stride]]):
             self.kill_kye(self.kye)
             return True
         return False
@@ -487,25 +1037,67 @@ class KGame:
             if self.kye:
                 self.check_monsters()
 
-        # Shallow copy the thinkers list, because we must iterate over it while modifying it
-        current_thinkers = self.thinkers[:]
-
-        # Animate/move active objects in order.
-        for f, t in current_thinkers:
-            if tics % f == 0:
-                try:
-                    x, y = self.get_location(t)
-                except KeyError:  # Object was deleted during this tick
-                    continue
-
-                # If the object indicates it, request a display update for it.
-                if t.think(self, x, y):
-                    self.invalidate[x+y*XSIZE] = 1
+        # Animate/move the active objects due this tick, in order.
+        #
+        # An object which can sleep (see Base.sleeper) and which neither
+        # moves nor changes when it thinks is put to sleep: it would do just
+        # the same next time, until something within two squares of it
+        # changes, at which point it is woken again by wake(). Sleeping
+        # objects keep their place in the thinking order, so an object woken
+        # earlier in a tick still thinks in its usual turn.
+        sleeping = self.sleeping
+        stride = self.stride
+        origin = self.origin
+        for t in self.thinkers.due(tics):
+            x, y = t.x, t.y
+            pos = stride*y + x + origin
+            if sleeping[pos]:
+                continue
+
+            # If the object indicates it, request a display update for it.
+            if t.think(self, x, y):
+                if self.observed:
+                    self.mark_dirty(pos)
+                if self.nasleep:
+                    self.wake(pos)
+            elif self.allow_sleep and t.x == x and t.y == y and t.sleeper:
+                sleeping[pos] = 1
+                self.nasleep += 1
+                self.thinkers.sleep(t)
 
         # Update animation counter.
         if self.tics % 3 == 0:
             self.animate_frame = self.animate_frame + 1
 
+        if self.dirtylist:
+            self.__redraw()
+
+
+class KLevelTemplate:
+    """A level as it is at the start of a game, from which KGame makes new games of the level without loading it again.
+
+    This holds everything about the level which KGame would otherwise read
+    from the level file, with the objects as a snapshot (see
+    KGame.snapshot). Nothing in it is changed once it is made."""
+    __slots__ = ('levelnum', 'thislev', 'hint', 'exitmsg', 'nextlevel',
+                 'width', 'height', 'kyestart', 'walls', 'floor', 'state')
+
+    def __init__(self, levelnum: int, thislev: str, hint: str, exitmsg: str,
+                 nextlevel: str, width: int, height: int,
+                 kyestart: Tuple[int, int], walls: tuple, floor: tuple,
+                 state: tuple) -> None:
+        self.levelnum = levelnum
+        self.thislev = thislev
+        self.hint = hint
+        self.exitmsg = exitmsg
+        self.nextlevel = nextlevel
+        self.width = width
+        self.height = height
+        self.kyestart = kyestart
+        self.walls = walls
+        self.floor = floor
+        self.state = state
+
 
 class KyeGameRuntimeError(RuntimeError):
     pass
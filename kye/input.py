@@ -23,24 +23,17 @@ gi.require_version("Gdk", "3.0")
 from gi.repository import Gdk
 from gi.repository.Gdk import keyval_from_name
 
-import pickle
-from gzip import GzipFile
-import os.path
 from pathlib import Path
-from random import Random
-from typing import Any, List, Optional, Tuple, Union
+from typing import List, Optional, Tuple
 
-from kye.common import VERSION
-
-
-Move = Tuple[str, int, int]
+from kye.recording import KEYFRAME_TICKS, KRecordWriter, Move
 
 
 class KMoveInput:
     """Gets movement input, and converts it into game actions."""
 
     def __init__(self) -> None:
-        self.__recordto: Optional[GzipFile] = None
+        self.__recordto: Optional[KRecordWriter] = None
         self.clear()
 
     def clear(self) -> None:
@@ -151,17 +144,15 @@ class KMoveInput:
     def record_to(self, recfile: Path,
                   playfile: Path,
                   playlevel: str,
-                  rng: Random) -> None:
-        """Set this input to be recorded to the supplied stream."""
-        # Open the stream
-        stream = GzipFile(recfile, "w")
-        self.__recordto = stream
-
-        # Write header
-        stream.write(bytes("Kye %s recording:\n" % VERSION, "UTF-8"))
-        stream.write(bytes(os.path.basename(playfile) + "\n", "UTF-8"))
-        stream.write(bytes(playlevel + "\n", "UTF-8"))
-        pickle.dump(rng.getstate(), stream)
+                  seed: int) -> None:
+        """Set this input to be recorded to the supplied stream, for a game whose random number generator is seeded with seed."""
+        self.__recordto = KRecordWriter(recfile, playfile, playlevel, seed,
+                                        keyframe_ticks=KEYFRAME_TICKS)
+
+    def tick(self, game) -> None:
+        """Call after each tick of the game, so that any recording can keep keyframes of it."""
+        if self.__recordto is not None:
+            self.__recordto.tick(game)
 
     def is_recording(self) -> bool:
         """Return true iff we are recording at the moment."""
@@ -171,57 +162,5 @@ class KMoveInput:
         """Gets the move from the current keys/mouse state (and records the move if required)."""
         m = self.__get_move()
         if self.__recordto is not None:
-            if m is not None:
-                self.__recordto.write(bytes("\t".join(map(str, m)), "UTF-8"))
-            self.__recordto.write(b"\n")
+            self.__recordto.write(m)
         return m
-
-
-class KDemoError(Exception):
-    pass
-
-
-class KDemoFormatError(KDemoError):
-    pass
-
-
-class KDemoFileMismatch(KDemoError):
-    def __init__(self, filename: Union[Path, str]) -> None:
-        KDemoError.__init__(self)
-        self.filename = filename
-
-
-class KyeRecordedInput:
-    """An input source which is a recording in a file of a previous game."""
-
-    def __init__(self, playfile: Path, playback: Path) -> None:
-        instream = GzipFile(playback)
-        header = instream.readline().rstrip().decode()
-        if not (header.startswith("Kye ") and header.endswith(" recording:")):
-            raise KDemoFormatError()
-
-        # Check filename in the demo is what we have loaded.
-        fn = instream.readline().rstrip().decode()
-        if fn != os.path.basename(playfile):
-            raise KDemoFileMismatch(fn)
-
-        # Okay
-        self.__level = instream.readline().rstrip().decode()
-        self.__rng: Tuple[Any, ...] = pickle.load(instream)
-        self.__s: GzipFile = instream
-
-    def get_level(self) -> str:
-        """Return the level name for this recording."""
-        return self.__level
-
-    def set_rng(self, rng: Random) -> None:
-        """Set the supplied RNG to the state needed for this recording."""
-        rng.setstate(self.__rng)
-
-    def get_move(self) -> Optional[Move]:
-        """Get a move from the recording."""
-        line = self.__s.readline().rstrip().decode()
-        if len(line) == 0:
-            return None
-        s = line.split("\t")
-        return (s[0], int(s[1]), int(s[2]))
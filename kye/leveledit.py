@@ -19,7 +19,8 @@
 """Functions and classes for the level editor."""
 
 from copy import deepcopy
-from kye.common import XSIZE, YSIZE
+from kye.common import XSIZE, YSIZE, read_board, size_header
+from kye.levelset import KLevelSet
 
 
 def freq(s):
@@ -96,9 +97,37 @@ class KLevelEdit:
 
     def __init__(self, f, disp, newleveltemplate,
                  setlevellist=None, hintmenuitems=None):
+        """Load the levels from f, a level set file or a KLevelSet."""
         self.levels = []
         self.__disp = disp
 
+        if isinstance(f, KLevelSet):
+            self.__load_set(f)
+        else:
+            self.__load(f)
+
+        # Callbacks to the frame
+        self.__setlevellist = setlevellist
+        self.__hintmenuitems = hintmenuitems
+
+        # Undo history & modified/saved state tracking
+        self.__undohist = []
+        self.__mods = 0
+        self.__mods_lastsave = 0
+        self.__mods_lastcheckpoint = 0
+        self.__lastcheckpoint_level = None
+
+        # Other state here
+        self.__newlevel = newleveltemplate
+        self.__autoround = True
+
+        # set selected level & update level list
+        self.setlevel(0)
+        self.updatelevellist()
+        self.undohint()
+
+    def __load(self, f):
+        """Read the levels from level set file f."""
         # First line is # of levels. We don't need/use this.
         _ = f.readline()
         while 1:
@@ -107,6 +136,7 @@ class KLevelEdit:
                 break
 
             # Each level has NAME<CRLF>Hint<CRLF>Exit message<CRLF>20x(Level data<CRLF>)
+            # (or another size, given by a size header - see read_board)
             lname = l.strip().upper()
             hint = f.readline().strip()
             if hint == "":
@@ -116,57 +146,50 @@ class KLevelEdit:
                 break
 
             # read in the board
-            board = []
-            for y in range(YSIZE):
-                l = f.readline()
-                for x in range(XSIZE):
-                    c = l[x]
-
-                    # Edge tiles must be walls - as in original Kye, force this.
-                    if c not in KLevelEdit.wall and (x == 0 or
-                                                     y == 0 or
-                                                     x == XSIZE-1 or
-                                                     y == YSIZE-1):
-                        c = '5'
-
-                    board.append(c)
-
-            # The board, plus the level strings, makes the level. Add to our list of levels.
-            newlevel = {'name': lname,
-                        'hint': hint,
-                        'exitmsg': exitmsg,
-                        'board': board}
-            self.levels.append(newlevel)
+            width, height, rows = read_board(f)
+            self.__add_level(lname, hint, exitmsg, width, height,
+                             "".join([row[:width] for row in rows]))
 
         # All done, close the file.
         f.close()
 
-        # Callbacks to the frame
-        self.__setlevellist = setlevellist
-        self.__hintmenuitems = hintmenuitems
-
-        # Undo history & modified/saved state tracking
-        self.__undohist = []
-        self.__mods = 0
-        self.__mods_lastsave = 0
-        self.__mods_lastcheckpoint = 0
-        self.__lastcheckpoint_level = None
-
-        # Other state here
-        self.__newlevel = newleveltemplate
-        self.__autoround = True
-
-        # set selected level & update level list
-        self.setlevel(0)
-        self.updatelevellist()
-        self.undohint()
+    def __load_set(self, levelset):
+        """Take the levels from a KLevelSet, stopping where __load would."""
+        for n in range(1, len(levelset) + 1):
+            (_, lname, hint, exitmsg,
+             width, height, board, _) = levelset.level(n)
+            if hint == "" or exitmsg == "":
+                break
+            self.__add_level(lname, hint, exitmsg, width, height, board)
+
+    def __add_level(self, lname, hint, exitmsg, width, height, board):
+        """Add a level; board is its squares, row by row, as a string."""
+        board = list(board)
+
+        # Edge tiles must be walls - as in original Kye, force this.
+        last = width*(height-1)
+        for edge in (range(width), range(last, last+width),
+                     range(width, last, width), range(2*width-1, last, width)):
+            for i in edge:
+                if board[i] not in KLevelEdit.wall:
+                    board[i] = '5'
+
+        # The board, plus the level strings, makes the level. Add to our list of levels.
+        newlevel = {'name': lname,
+                    'hint': hint,
+                    'exitmsg': exitmsg,
+                    'width': width,
+                    'height': height,
+                    'board': board}
+        self.levels.append(newlevel)
 
     # Maintain currently edited level and level list, notifying the view accordingly
 
     def setlevel(self, n):
         """Set the level currently being edited to number n."""
         self.curlevel = n
-        self.__disp.game_redraw(self, [1]*(XSIZE*YSIZE))
+        self.__disp.game_redraw(self, [(x, y) for y in range(self.height)
+                                       for x in range(self.width)])
 
     def updatelevellist(self):
         """This pushes the useful level data in this level set to the frame class."""
@@ -298,16 +321,26 @@ class KLevelEdit:
         """Gets a list with the names of the levels in this level set, in order"""
         return [i['name'] for i in self.levels]
 
+    @property
+    def width(self):
+        """Width of the currently edited level"""
+        return self.levels[self.curlevel].get('width', XSIZE)
+
+    @property
+    def height(self):
+        """Height of the currently edited level"""
+        return self.levels[self.curlevel].get('height', YSIZE)
+
     # Get and set tile methods, plus autorounding etc
     def get_tile(self, i, j):
         """Look up the content of a tile in the currently-edited level"""
-        return KLevelEdit.cell_lookup[self.levels[self.curlevel]['board'][XSIZE*j + i]][0]
+        return KLevelEdit.cell_lookup[self.levels[self.curlevel]['board'][self.width*j + i]][0]
 
     def wall_at(self, x, y):
         """Returns 1 if the nominated tile in the currently edited level is a wall (or is out of bounds), 0 otherwise"""
-        if x < 0 or y < 0 or y >= YSIZE or x >= XSIZE:
+        if x < 0 or y < 0 or y >= self.height or x >= self.width:
             return 1
-        if self.levels[self.curlevel]['board'][XSIZE*y + x] in KLevelEdit.wall:
+        if self.levels[self.curlevel]['board'][self.width*y + x] in KLevelEdit.wall:
             return 1
         else:
             return 0
@@ -329,17 +362,17 @@ class KLevelEdit:
         self.autoround_cell(x, y)
         if x > 0:
             self.autoround_cell(x-1, y)
-        if x < XSIZE-1:
+        if x < self.width-1:
             self.autoround_cell(x+1, y)
         if y > 0:
             self.autoround_cell(x, y-1)
-        if y < YSIZE-1:
+        if y < self.height-1:
             self.autoround_cell(x, y+1)
 
     def set_at(self, i, j, t):
         """Sets a given tile, plus updated neighbouring cells wall rounding, plus updates modification count and may checkpoint if needed"""
         self.newmod()
-        if i == 0 or j == 0 or i == XSIZE-1 or j == YSIZE-1:
+        if i == 0 or j == 0 or i == self.width-1 or j == self.height-1:
             if t != '5':
                 return
         try:
@@ -351,12 +384,11 @@ class KLevelEdit:
 
     def set_at_simple(self, i, j, t):
         """Edits a single cell, and redraws it"""
-        if i < 0 or j < 0 or i >= XSIZE or j >= YSIZE:
+        width, height = self.width, self.height
+        if i < 0 or j < 0 or i >= width or j >= height:
             raise IndexError
-        self.levels[self.curlevel]['board'][XSIZE*j + i] = t
-        w = [0]*(XSIZE*YSIZE)
-        w[XSIZE*j + i] = 1
-        self.__disp.game_redraw(self, w)
+        self.levels[self.curlevel]['board'][width*j + i] = t
+        self.__disp.game_redraw(self, [(i, j)])
 
     def check(self):
         """Check for errors before saving"""
@@ -384,9 +416,13 @@ class KLevelEdit:
             f.write(bytes("%s\r\n%s\r\n%s\r\n" %
                           (l['name'], l['hint'], l['exitmsg']),
                           "utf-8"))
+            width = l.get('width', XSIZE)
+            height = l.get('height', YSIZE)
+            if (width, height) != (XSIZE, YSIZE):
+                f.write(bytes(size_header(width, height) + "\r\n", "utf-8"))
             i = 0
-            for y in range(YSIZE):
-                for x in range(XSIZE):
+            for y in range(height):
+                for x in range(width):
                     f.write(bytes(l['board'][i], "utf-8"))
                     i = i + 1
                 f.write(b"\r\n")
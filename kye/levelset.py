@@ -0,0 +1,247 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""kye.levelset - contains the KLevelSet class, for getting at the levels in a level set file."""
+
+import hashlib
+import io
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from xdg import BaseDirectory
+
+from kye.common import read_board
+
+# A compiled level set (.kyec) is: the header; the offset of each level's
+# record; the name of each level (the name index); then the level records.
+# Each record is its width, height and the lengths of its hint, exit message
+# and the name of the level after it, followed by those strings and then the
+# board, one byte per square, row by row. All numbers are little-endian and
+# strings are UTF-8. The header holds the SHA-1 of the level set file it was
+# compiled from.
+KYEC_MAGIC = b"KYEC"
+KYEC_VERSION = 1
+_HEADER = struct.Struct("<4sHI20s")
+_NAME = struct.Struct("<H")
+_RECORD = struct.Struct("<HHHHH")
+
+# What a level set gives for each level: its number, name, hint, exit
+# message, width, height, board (width*height characters, row by row) and
+# the name of the level after it.
+LevelData = Tuple[int, str, str, str, int, int, str, str]
+
+
+_cachedir: Optional[Path] = None
+
+
+def _cache_dir() -> Path:
+    """Return the directory compiled level sets are kept in, making it if need be."""
+    global _cachedir
+    if _cachedir is None:
+        _cachedir = Path(BaseDirectory.save_cache_path("kye"))
+    return _cachedir
+
+
+def compile_levels(data: bytes) -> bytes:
+    """Return the compiled form of a level set file, given its contents.
+
+    The file is read just as KGame reads it, so this is the only place
+    where the levels are parsed as text."""
+    digest = hashlib.sha1(data).digest()
+    # Decoded just as open() would.
+    f = io.TextIOWrapper(io.BytesIO(data))
+    f.readline()  # the count of levels
+    names: List[bytes] = []
+    records: List[bytes] = []
+    name = f.readline().strip().upper()
+    while name != "" and name != "\x1a":
+        hint = f.readline().strip().encode("utf-8")
+        exitmsg = f.readline().strip().encode("utf-8")
+        width, height, rows = read_board(f)
+        board = "".join([row[:width] for row in rows]).encode("latin-1", "replace")
+        line = f.readline().strip()
+        nextlevel = b"" if line == "\x1a" else line.encode("utf-8")
+        names.append(name.encode("utf-8"))
+        records.append(b"".join([
+            _RECORD.pack(width, height, len(hint), len(exitmsg), len(nextlevel)),
+            hint, exitmsg, nextlevel, board]))
+        name = line.upper()
+
+    nametable = b"".join([_NAME.pack(len(n)) + n for n in names])
+    offset = _HEADER.size + 4*len(records) + len(nametable)
+    offsets = []
+    for record in records:
+        offsets.append(offset)
+        offset += len(record)
+    return b"".join([_HEADER.pack(KYEC_MAGIC, KYEC_VERSION, len(records), digest),
+                     struct.pack("<%dI" % len(offsets), *offsets),
+                     nametable] + records)
+
+
+class KLevelSet:
+    """The levels in a level set file, which can be got at by name or number without reading all the levels before them.
+
+    The file is compiled (see compile_levels) into the user's cache
+    directory, under the hash of its contents, and the compiled form is
+    mapped into memory; loading a level just slices it out of that. The file
+    is only compiled again when its contents change.
+
+    KGame keeps the levels it has loaded in templates, by level number;
+    these are thrown away if the file changes."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.__data: Union[mmap.mmap, bytes] = b""
+        self.__view = memoryview(b"")
+        self.__stamp: Tuple[int, int] = (-1, -1)
+        self.__digest = b""
+        self.names: List[str] = []
+        self.__numbers: Dict[str, int] = {}
+        self.__offsets: Tuple[int, ...] = ()
+        self.templates: Dict[int, Any] = {}
+        self.__load()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def close(self) -> None:
+        """Release the compiled level set."""
+        self.__view.release()
+        if isinstance(self.__data, mmap.mmap):
+            self.__data.close()
+        self.__data = b""
+        self.__view = memoryview(b"")
+
+    def number(self, level: str) -> int:
+        """Return the number (counting from 1) of the named level; or of the first level, for ""."""
+        self.__check()
+        return self.__number(level)
+
+    def __number(self, level: str) -> int:
+        if level == "" and self.names:
+            return 1
+        try:
+            return self.__numbers[level]
+        except KeyError:
+            raise KeyError("level %s not found" % level)
+
+    def level(self, level: Union[str, int]) -> LevelData:
+        """Return a level, given its name or number (see LevelData)."""
+        self.__check()
+        levelnum = self.__number(level) if isinstance(level, str) else level
+        if not 0 < levelnum <= len(self.names):
+            raise KeyError("level %d not found" % levelnum)
+        view = self.__view
+        pos = self.__offsets[levelnum - 1]
+        width, height, nhint, nexit, nnext = _RECORD.unpack_from(view, pos)
+        pos += _RECORD.size
+        hint = str(view[pos:pos+nhint], "utf-8")
+        pos += nhint
+        exitmsg = str(view[pos:pos+nexit], "utf-8")
+        pos += nexit
+        nextlevel = str(view[pos:pos+nnext], "utf-8")
+        pos += nnext
+        board = str(view[pos:pos+width*height], "latin-1")
+        return (levelnum, self.names[levelnum - 1], hint, exitmsg,
+                width, height, board, nextlevel)
+
+    def __check(self) -> None:
+        """Pick up any change to the file since it was compiled."""
+        st = os.stat(self.path)
+        if (st.st_size, st.st_mtime_ns) != self.__stamp:
+            self.close()
+            self.__load()
+
+    def __load(self) -> None:
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                    digest = hashlib.sha1(source).digest()
+            else:
+                digest = hashlib.sha1(b"").digest()
+        self.__stamp = (st.st_size, st.st_mtime_ns)
+        if digest != self.__digest:
+            self.templates = {}
+        self.__digest = digest
+
+        try:
+            cache: Optional[Path] = _cache_dir() / ("%s.kyec" % digest.hex())
+        except OSError:
+            cache = None  # no cache directory: compile into memory
+        if cache is None or not self.__map(cache):
+            with open(self.path, "rb") as f:
+                data = compile_levels(f.read())
+            try:
+                if cache is not None:
+                    tmp = cache.with_suffix(".tmp%d" % os.getpid())
+                    with open(tmp, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp, cache)
+            except OSError:
+                pass  # the cache only saves time
+            if cache is None or not self.__map(cache):
+                self.__use(data)
+
+    def __map(self, cache: Path) -> bool:
+        """Use the compiled level set in cache, if it is there and is for the file as it is now."""
+        try:
+            with open(cache, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        try:
+            self.__use(data)
+            return True
+        except (struct.error, UnicodeDecodeError, ValueError):
+            self.close()
+            return False
+
+    def __use(self, data: Union[mmap.mmap, bytes]) -> None:
+        self.__data = data
+        self.__view = view = memoryview(data)
+        magic, version, count, digest = _HEADER.unpack_from(view, 0)
+        if magic != KYEC_MAGIC or version != KYEC_VERSION or digest != self.__digest:
+            raise ValueError("compiled level set is out of date")
+        pos = _HEADER.size
+        self.__offsets = struct.unpack_from("<%dI" % count, view, pos)
+        pos += 4*count
+        names = []
+        for i in range(count):
+            n, = _NAME.unpack_from(view, pos)
+            pos += _NAME.size
+            names.append(str(view[pos:pos+n], "utf-8"))
+            pos += n
+
+        # The records must follow on one after another to the very end, or
+        # the file was cut short (or is otherwise not what was written).
+        end = pos
+        for offset in self.__offsets:
+            if offset != end:
+                raise ValueError("compiled level set is damaged")
+            width, height, nhint, nexit, nnext = _RECORD.unpack_from(view, offset)
+            end = offset + _RECORD.size + nhint + nexit + nnext + width*height
+        if end != len(view):
+            raise ValueError("compiled level set is damaged")
+        self.names = names
+        self.__numbers = {}
+        for n, name in enumerate(names, 1):
+            self.__numbers.setdefault(name, n)
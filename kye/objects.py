@@ -19,20 +19,113 @@
 """Classes for individual objects in the game, implementing their behaviour and animations."""
 
 import abc
-from random import Random
+from typing import Tuple
 
 dirmap = ("up", "left", "right", "down")
 
+# Type codes, as stored in the compact board held by KGame. Every code from
+# KYEGHOST upwards belongs to an animate (Thinker) object.
+EMPTY, WALL, KYE, EDIBLE, DIAMOND, ONEWAY = range(6)
+KYEGHOST, BLOCK, SENTRY, MONSTER, MAGNET, SLIDER, SHOOTER, BLACKHOLE = range(6, 14)
+NCODES = 14
+
+
+def dirindex(dx, dy):
+    """Returns the index in dirmap of the direction (dx, dy)."""
+    return dy + 1 + (dx + dy + 1) // 2
+
+
+def zdir(dx, dy):
+    """Returns a distinct number 0..8 for each (dx, dy), for use in object states (see Base.zstate)."""
+    return 3*dx + dy + 4
+
 
 def direction(dx, dy):
-    return dirmap[dy + 1 + (dx + dy + 1) // 2]
+    return dirmap[dirindex(dx, dy)]
+
+
+def dirimages(fmt):
+    """Returns the image names for fmt % direction, indexed by dirindex.
+
+    Objects look their image names up in tables like this, rather than
+    building a new string every time they are drawn."""
+    return tuple(fmt % d for d in dirmap)
+
+
+def codetable(*codes):
+    """Returns a table, indexed by type code, holding 1 for the given codes and 0 for all others."""
+    return bytes(1 if c in codes else 0 for c in range(NCODES))
+
+
+# The rules for how objects interact, as tables indexed by type code.
+PUSHABLE = codetable(*range(KYEGHOST, NCODES))  # other objects can push it
+EATABLE = codetable(EDIBLE, DIAMOND)            # the Kye eats it by moving into it
+SWALLOWS = codetable(BLACKHOLE)                 # things moving into it may be swallowed
+LETHAL = codetable(MONSTER)                     # kills the Kye if beside it
+
+# Ways that a rocky can roll around a rounded obstacle: towards +x/+y, or -x/-y.
+PLUS, MINUS = 1, 2
+
+
+def deflection(tr, dx, dy):
+    """Which ways (PLUS and/or MINUS) can a rocky moving in direction (dx, dy) roll off an obstacle with roundness tr?
+
+    This only considers the shape of the obstacle, not whether the squares the
+    rocky would roll into are clear."""
+    if tr == 0:
+        return 0
+    plus, minus = False, False
+    if dx != 0:
+        if tr % 3 == 2 or (tr+dx) % 3 == 2:
+            minus = tr > 3
+            plus = tr < 7
+    else:  # dy != 0
+        if tr < 4 or tr > 6:
+            tr -= 3*dy
+        if tr == 4:
+            plus, minus = False, True
+        elif tr == 5:
+            plus, minus = True, True
+        elif tr == 6:
+            plus, minus = True, False
+    return (PLUS if plus else 0) | (MINUS if minus else 0)
+
+
+# deflection() for every roundness and direction: DEFLECT[9*tr + 3*dx + dy + 4]
+DEFLECT = bytes(deflection(tr, dx, dy)
+                for tr in range(10) for dx in (-1, 0, 1) for dy in (-1, 0, 1))
 
 
 class Base(metaclass=abc.ABCMeta):
-    """This is the virtual base-class for all in-game objects."""
+    """This is the virtual base-class for all in-game objects.
+
+    Games can hold a great many objects, so every class in this hierarchy uses
+    __slots__ for its per-object state; anything that is the same for all
+    objects of a class belongs on the class."""
+    __slots__ = ('x', 'y', 'sched_bucket', 'sched_index', 'zkey')
+    code = EMPTY  # type code for this class of object; see the table above
+
+    # True if, when this object thinks and neither moves nor returns true, the
+    # game may put it to sleep until something near it changes. Only objects
+    # whose think depends on nothing but their own state and the squares
+    # within two of them (including magnets) may set this.
+    sleeper = False
+
+    # The slots which hold other objects, rather than plain values (see
+    # KGame.snapshot).
+    refs: Tuple[str, ...] = ()
+
+    # Where the object is in the KScheduler it thinks in; set only while it
+    # is a thinker, so not present on other objects.
+    sched_bucket: int
+    sched_index: int
 
     def __init__(self) -> None:
-        pass
+        # Location on the board, maintained by the game; x is -1 when the
+        # object is not on the board.
+        self.x = -1
+        self.y = -1
+        self.zkey = 0  # this object's part in KGame.zhash, while on the board
 
     def roundness(self) -> int:
         """Returns the 'roundness' of this object.
@@ -53,12 +146,24 @@ class Base(metaclass=abc.ABCMeta):
         should 'think', and may change its graphic, every freq/10 seconds."""
         return 0
 
+    def zstate(self) -> int:
+        """Returns a number summing up the state of this object, for KGame's state hash.
+
+        Objects of the same type which would behave differently must return
+        different numbers. Whenever this changes for an object on the board,
+        the object must call game.rekey(self). Animation which never affects
+        play is left out."""
+        return 0
+
     @abc.abstractmethod
     def image(self, af: int) -> str: pass
 
 
 class Kye(Base):
     """The Kye itself."""
+    code = KYE
+    __slots__ = ('lives', 'under')
+    refs = ('under',)
 
     def __init__(self):
         Base.__init__(self)
@@ -68,11 +173,17 @@ class Kye(Base):
     def image(self, af):
         return "kye"
 
+    def zstate(self):
+        under = 0 if self.under is None else 1 + self.under.zstate()
+        return 16*self.lives + under
+
 
 class Wall(Base):
     """There are 9 types of wall, indicated by 1..9.
 
     5 indicates totally square. 1..4, 6..9 indicate the roundness."""
+    code = WALL
+    __slots__ = ('t',)
 
     def __init__(self, t):
         """t -- the type (roundness) of the wall."""
@@ -84,12 +195,19 @@ class Wall(Base):
             return 0
         return self.t
 
+    images = tuple("wall%d" % t for t in range(10))
+
     def image(self, af):
-        return "wall%s" % self.t
+        return Wall.images[self.t]
+
+    def zstate(self):
+        return self.t
 
 
 class Edible(Base):
     """Edible block object."""
+    code = EDIBLE
+    __slots__ = ()
 
     def image(self, af):
         return "blocke"
@@ -97,20 +215,27 @@ class Edible(Base):
 
 class Diamond(Edible):
     """Object representing a diamond."""
-    r = Random()        # Used purely for animation.
+    code = DIAMOND
+    __slots__ = ('state',)
 
-    def __init__(self):
+    def __init__(self, state: int = 1):
         Edible.__init__(self)
-        self.state = Diamond.r.randint(1, 2)
+        self.state = state
+
+    def start_animation(self, rng) -> None:
+        """Start at a random point in the animation, using rng (see KGame.animation)."""
+        self.state = rng.randint(1, 2)
+
+    images = ("diamond_1", "diamond_2")
 
     def image(self, af):
-        return "diamond_%s" % self.state
+        return Diamond.images[self.state - 1]
 
     def freq(self):
         return 20
 
     def think(self, game, x, y):
-        if Diamond.r.randint(1, 10) == 1:
+        if game.animation.randint(1, 10) == 1:
             self.state = self.state ^ 3
             return True
         return False
@@ -118,10 +243,8 @@ class Diamond(Edible):
 
 class Thinker(Base):
     """Virtual base class for all in-game animate objects."""
-
-    def __init__(self):
-        Base.__init__(self)
-        self.autoanim = False
+    __slots__ = ()
+    autoanim = False  # true if the image changes every think, even standing still
 
     def freq(self):
         """Default is for animate objects to 'think' every game tick."""
@@ -134,7 +257,7 @@ class Thinker(Base):
         any magnet on the object to take effect. Only if it is not under the
         effect of a magnet, then self.act is called to allow the object to
         act."""
-        if game.magnet_count[30*y + x] > 0:
+        if game.magnet_field[game.stride*y + x + game.origin]:
             if self.pulltomagnet(game, x, y):
                 return self.autoanim
         return self.act(game, x, y)
@@ -144,26 +267,22 @@ class Thinker(Base):
 
     def pulltomagnet(self, game, x, y):
         """Performs the effect of any nearby magnet on this object."""
-
-        # state[0] is set to true if we are stuck on a magnet
-        # stare[1,2] is the location we are to be pulled to by a magnet
-        state = [False, x, y]
-        checkmagnet(game, x, y, -1,  0, state)
-        checkmagnet(game, x, y,  1,  0, state)
-        checkmagnet(game, x, y,  0, -1, state)
-        checkmagnet(game, x, y,  0,  1, state)
+        v = game.magnet_field[game.stride*y + x + game.origin]
 
         # If we are being pulled, move & return 1 as we have moved.
         # Else, just return whether we are stuck on a magnet.
-        if x != state[1] or y != state[2]:
-            game.move_object(x, y, state[1], state[2])
+        pull = PULL_ANY[v]
+        if pull is not None:
+            game.move_object(x, y, x+pull[0], y+pull[1])
             return True
-        else:
-            return state[0]
+        return (v & STUCK_BITS) != 0
 
 
 class KyeGhost(Thinker):
     """This is the ghost of a dead kye. It lasts just a few frames and them removes itself."""
+    code = KYEGHOST
+    __slots__ = ('frame', 'kye')
+    refs = ('kye',)
     frames = ("kye", "kye_fading", "kye_faint")
 
     def __init__(self, k):
@@ -174,8 +293,12 @@ class KyeGhost(Thinker):
     def image(self, af):
         return KyeGhost.frames[self.frame]
 
+    def zstate(self):
+        return self.frame
+
     def think(self, game, x, y):
         self.frame = self.frame+1
+        game.rekey(self)
         if self.frame > 2:
             if self.kye.lives >= 0:
                 game.respawn_kye(self.kye)
@@ -185,6 +308,8 @@ class KyeGhost(Thinker):
 
 class Block(Thinker):
     """Square or round moveable block. Also turning blocks and timer blocks."""
+    code = BLOCK
+    __slots__ = ('timer', 'round', '__turn')
 
     def __init__(self, t, round, timer=0):
         """3 parameters:
@@ -205,13 +330,20 @@ class Block(Thinker):
             return 5
         return 0
 
+    @property
+    def sleeper(self):
+        # Timer blocks count down, so never sleep.
+        return self.timer == 0
+
     def turn(self):
         """Returns -1 or 1 if sliders/rounders hitting this block should be turned left or right; 0 for an ordinary block."""
         return self.__turn
 
+    timer_images = tuple("block_timer_%d" % i for i in range(10))
+
     def image(self, af):
         if self.timer > 0:
-            return "block_timer_%s" % (self.timer // 30)
+            return Block.timer_images[self.timer // 30]
         if self.round:
             return "blockr"
         if self.__turn == -1:
@@ -220,13 +352,18 @@ class Block(Thinker):
             return "turner_clockwise"
         return "block"
 
+    def zstate(self):
+        return 8*self.timer + 4*self.round + self.__turn + 1
+
     def think(self, game, x, y):
         """Count down timer blocks and flag the caller when the image changes."""
         if self.timer > 0:
             self.timer = self.timer - 1
+            game.rekey(self)
             if self.timer == 0:
                 game.remove_at(x, y)
-        if game.magnet_count[30*y + x] > 0:
+                return False
+        if game.magnet_field[game.stride*y + x + game.origin]:
             self.pulltomagnet(game, x, y)
         if self.timer == 0:
             return False
@@ -235,14 +372,21 @@ class Block(Thinker):
 
 class Sentry(Thinker):
     """This represents a sentry, or 'bouncer' as the original Kye termed them."""
+    code = SENTRY
+    __slots__ = ('dx', 'dy')
 
     def __init__(self, idx, idy):
         Thinker.__init__(self)
         self.dx = idx
         self.dy = idy
 
+    images = dirimages("sentry_%s")
+
     def image(self, af):
-        return "sentry_%s" % direction(self.dx, self.dy)
+        return Sentry.images[dirindex(self.dx, self.dy)]
+
+    def zstate(self):
+        return zdir(self.dx, self.dy)
 
     def freq(self):
         return 5
@@ -250,44 +394,54 @@ class Sentry(Thinker):
     def act(self, game, x, y):
         # Look at what we are walking into
         dx, dy = self.dx, self.dy
-        t = game.get_atB(x + dx, y + dy)
+        tpos = game.stride*(y+dy) + x+dx + game.origin
+        tc = game.cells[tpos]
 
         # If it's a blackhole, we are destroyed in it if it is ready to eat.
-        if isinstance(t, BlackHole):
-            if t.swallow(game):
+        if SWALLOWS[tc]:
+            if game.board[tpos].swallow(game):
                 game.remove_at(x, y)
                 return
             # else drop through - we can push a full blackhole.
 
         # If there is nothing ahead, move ahead
-        if t is None:
+        if tc == EMPTY:
             game.move_object(x, y, x+dx, y+dy)
             return False
         else:
             # else we push the object ahead and turn around.
             game.push_object(x+dx, y+dy, dx, dy)
             self.dx, self.dy = -dx, -dy
+            game.rekey(self)
             return True
 
 
 class Monster(Thinker):
     """All the monster types are represented by this class."""
-    r = Random()
+    code = MONSTER
+    __slots__ = ('type', 'frame')
     names = ("gnasher", "twister", "spike", "snake", "blob")
+    nframes = (2, 2, 2, 2, 4)  # number of animation frames, by type
+    images = tuple(tuple("%s_%d" % (name, i) for i in range(1, n+1))
+                   for name, n in zip(names, nframes))
+    autoanim = True
 
-    def __init__(self, type):
-        """Creating a monster, one parameter: an int, 0..4, giving the type."""
+    def __init__(self, type, frame: int = 1):
+        """Creating a monster: type is an int, 0..4, giving the type, and frame the frame of its animation to start at."""
         Thinker.__init__(self)
         self.type = type
-        self.frames = 2
-        if type == 4:
-            self.frames = 4
-        self.frame = Monster.r.randint(1, self.frames)
-        self.autoanim = True
+        self.frame = frame
+
+    def start_animation(self, rng) -> None:
+        """Start at a random point in the animation, using rng (see KGame.animation)."""
+        self.frame = rng.randint(1, Monster.nframes[self.type])
 
     def image(self, af: int) -> str:
-        return "%s_%s" % (Monster.names[self.type],
-                          1 + ((self.frame + af) % self.frames))
+        t = self.type
+        return Monster.images[t][(self.frame + af) % Monster.nframes[t]]
+
+    def zstate(self):
+        return self.type
 
     def freq(self):
         return 3
@@ -352,30 +506,79 @@ class Monster(Thinker):
         t = game.get_at(tx, ty)
         if t is None:
             game.move_object(x, y, tx, ty)
-        elif wandering and isinstance(t, BlackHole) and t.swallow(game):
+        elif wandering and SWALLOWS[t.code] and t.swallow(game):
             game.remove_at(x, y)
         return True
 
 
-def checkmagnet(game, x, y, dx, dy, state):
-    """Checks whether (x,y) is affected by a magnet in a given direction.
+# Results from checkmagnet
+PULLED, STUCK = 1, 2
+
+# The directions in which magnets can act on a square, in the order in which
+# their pulls take effect (a later pull wins over an earlier one).
+MAGNET_DIRS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def checkmagnet(game, pos, dx, dy):
+    """Checks whether board index pos is affected by a magnet in a given direction.
 
     Checks for a magnet at (x+dx,y+dy) and (x+2*dx, y+2*dy) (if the latter
-    is not obstructed). Updates the 'state' array with the result.
+    is not obstructed). Returns STUCK if stuck to the adjacent magnet, PULLED
+    if pulled towards the one beyond it, or 0 if unaffected.
     """
-    a = game.get_atB(x+dx, y+dy)
-    if a is None:
-        b = game.get_atB(x+2*dx, y+2*dy)
-        if isinstance(b, Magnet):
+    step = game.stride*dy + dx
+    apos = pos + step
+    a = game.cells[apos]
+    if a == EMPTY:
+        if game.cells[apos + step] == MAGNET:
+            b = game.board[apos + step]
             if (b.dx != 0 and dx != 0) or (b.dy != 0 and dy != 0):
-                state[1:2] = x+dx, y+dy
-    elif isinstance(a, Magnet):
-        if (a.dx != 0 and dx != 0) or (a.dy != 0 and dy != 0):
-            state[0] = True
+                return PULLED
+    elif a == MAGNET:
+        b = game.board[apos]
+        if (b.dx != 0 and dx != 0) or (b.dy != 0 and dy != 0):
+            return STUCK
+    return 0
+
+
+def magnet_field_at(game, pos):
+    """Returns the combined effect of magnets on board index pos, as kept in KGame.magnet_field.
+
+    This packs the checkmagnet result for each of MAGNET_DIRS into two bits,
+    the first direction lowest."""
+    v = 0
+    for i, (dx, dy) in enumerate(MAGNET_DIRS):
+        v |= checkmagnet(game, pos, dx, dy) << 2*i
+    return v
+
+
+def _pull_table(mask):
+    """For each magnet field value, the (dx, dy) of the last pull in it among the directions allowed by mask, or None."""
+    table = []
+    for v in range(256):
+        pull = None
+        for i, d in enumerate(MAGNET_DIRS):
+            if (v & mask) >> 2*i & 3 == PULLED:
+                pull = d
+        table.append(pull)
+    return tuple(table)
+
+
+# Decoding magnet field values: the pull on an object (PULL_ANY), or on a
+# magnet, which is only pulled across its own axis (PULL_ACROSS_VERTICAL for
+# a vertical magnet, PULL_ACROSS_HORIZONTAL for a horizontal one); and
+# whether anything is stuck to an adjacent magnet.
+PULL_ANY = _pull_table(0xff)
+PULL_ACROSS_VERTICAL = _pull_table(0x0f)
+PULL_ACROSS_HORIZONTAL = _pull_table(0xf0)
+STUCK_BITS = sum(STUCK << 2*i for i in range(len(MAGNET_DIRS)))
 
 
 class Magnet(Thinker):
     """Represents a magnet (sticky block, in the original Kye)."""
+    code = MAGNET
+    __slots__ = ('dx', 'dy')
+    sleeper = True
 
     def __init__(self, idx, idy):
         Thinker.__init__(self)
@@ -387,14 +590,20 @@ class Magnet(Thinker):
             return "sticky_vertical"
         return "sticky_horizontal"
 
+    def zstate(self):
+        return zdir(self.dx, self.dy)
+
     def think(self, game, x, y):
         return self.act(game, x, y)
 
     def act(self, game, x, y):
         dx, dy = self.dx, self.dy
-        if isinstance(game.get_atB(x-2*dx, y-2*dy), Kye) and game.get_atB(x-dx, y-dy) is None:
+        cells = game.cells
+        pos = game.stride*y + x + game.origin
+        step = game.stride*dy + dx
+        if cells[pos - 2*step] == KYE and cells[pos - step] == EMPTY:
             game.move_object(x, y, x-dx, y-dy)
-        elif isinstance(game.get_atB(x+2*dx, y+2*dy), Kye) and game.get_atB(x+dx, y+dy) is None:
+        elif cells[pos + 2*step] == KYE and cells[pos + step] == EMPTY:
             game.move_object(x, y, x+dx, y+dy)
         else:
             self.pulltomagnet(game, x, y)
@@ -402,21 +611,20 @@ class Magnet(Thinker):
 
     def pulltomagnet(self, game, x, y):
         """This handles the special case of magnets pulling magnets."""
-        state = [False, x, y]
-
+        v = game.magnet_field[game.stride*y + x + game.origin]
         if self.dx == 0:
-            checkmagnet(game, x, y, -1, 0, state)
-            checkmagnet(game, x, y,  1, 0, state)
+            pull = PULL_ACROSS_VERTICAL[v]
         else:
-            checkmagnet(game, x, y, 0, -1, state)
-            checkmagnet(game, x, y, 0,  1, state)
-
-        if state[1] != x or state[2] != y:
-            game.move_object(x, y, state[1], state[2])
+            pull = PULL_ACROSS_HORIZONTAL[v]
+        if pull is not None:
+            game.move_object(x, y, x+pull[0], y+pull[1])
 
 
 class Slider(Thinker):
     """Represents a square or round slider."""
+    code = SLIDER
+    __slots__ = ('dx', 'dy', 'round')
+    sleeper = True
 
     def __init__(self, idx, idy, ir):
         Thinker.__init__(self)
@@ -429,107 +637,93 @@ class Slider(Thinker):
             return 5
         return 0
 
+    images = (dirimages("slider_%s"), dirimages("rocky_%s"))
+
     def image(self, af):
-        i = "slider_%s"
-        if self.round:
-            i = "rocky_%s"
-        return i % direction(self.dx, self.dy)
+        return Slider.images[self.round][dirindex(self.dx, self.dy)]
+
+    def zstate(self):
+        return 2*zdir(self.dx, self.dy) + self.round
 
 
     def act(self, game, x, y):
         dx, dy = self.dx, self.dy
+        cells = game.cells
+        pos = game.stride*y + x + game.origin
+        tpos = pos + game.stride*dy + dx
 
         # Try moving forward. Move into space, fall into black holes.
-        t = game.get_atB(x+dx, y+dy)
-        if t is None:
+        tc = cells[tpos]
+        if tc == EMPTY:
             game.move_object(x, y, x+dx, y+dy)
-        elif isinstance(t, BlackHole):
-            if t.swallow(game):
+        elif SWALLOWS[tc]:
+            if game.board[tpos].swallow(game):
                 game.remove_at(x, y)
         else:
             # Obstacle - if a block, check to see if we should turn.
-            if isinstance(t, Block):
-                tn = t.turn()
+            if tc == BLOCK:
+                tn = game.board[tpos].turn()
                 if tn != 0:
                     self.dx = -(tn*dy)
                     self.dy = tn*dx
+                    game.rekey(self)
                     return True
 
             # Round sliders can roll round rounded obstacles.
             if self.round:
-                tr = t.roundness()
-                if tr == 0:
-                    return False
-
                 # Rocky hitting a rounded surface - which ways can it deflect
-                plus, minus = False, False
-                if dx != 0:
-                    if tr % 3 == 2 or (tr+dx) % 3 == 2:
-                        minus = tr > 3
-                        plus = tr < 7
-                else:  # dy != 0
-                    if tr < 4 or tr > 6:
-                        tr -= 3*dy
-                    if tr == 4:
-                        plus, minus = False, True
-                    elif tr == 5:
-                        plus, minus = True, True
-                    elif tr == 6:
-                        plus, minus = True, False
+                ways = DEFLECT[9*game.rounds[tpos] + 3*dx + dy + 4]
 
                 # Obstacle is not rounded on either corner facing us - we are stuck
-                if not plus and not minus:
+                if not ways:
                     return False
 
-                if dx != 0:
-                    if plus and (game.get_atB(x, y+1) is not None or game.get_atB(x+dx, y+1) is not None):
-                        plus = False
-                    if minus and (game.get_atB(x, y-1) is not None or game.get_atB(x+dx, y-1) is not None):
-                        minus = False
-                else:  # dy != 0
-                    if plus and (game.get_atB(x+1, y) is not None or game.get_atB(x+1, y+dy) is not None):
-                        plus = False
-                    if minus and (game.get_atB(x-1, y) is not None or game.get_atB(x-1, y+dy) is not None):
-                        minus = False
+                # Rolling off towards +/- side means moving into the square
+                # beside the obstacle, so it and the square beside us must be clear.
+                side = game.stride if dx != 0 else 1
+                if ways & PLUS and (cells[pos+side] != EMPTY or cells[tpos+side] != EMPTY):
+                    ways &= ~PLUS
+                if ways & MINUS and (cells[pos-side] != EMPTY or cells[tpos-side] != EMPTY):
+                    ways &= ~MINUS
 
                 # No way forward due to target square(s) being occupied - stuck
-                if not plus and not minus:
+                if not ways:
                     return False
 
                 # If both ways forwand are possible, choose randomely
-                if plus and minus:
+                if ways == PLUS | MINUS:
                     if game.nextrand(2) == 0:
-                        plus = False
+                        ways = MINUS
                     else:
-                        minus = False
+                        ways = PLUS
 
-                # Work out which square that corresponds to
-                tdx, tdy = dx, dy
-                if plus:
-                    if tdx != 0:
-                        tdy = dy+1
+                # Work out which square that corresponds to, and move into it.
+                if ways == PLUS:
+                    if dx != 0:
+                        game.move_object(x, y, x+dx, y+1)
                     else:
-                        tdx = dx+1
+                        game.move_object(x, y, x+1, y+dy)
                 else:
-                    if tdx != 0:
-                        tdy = dy-1
+                    if dx != 0:
+                        game.move_object(x, y, x+dx, y-1)
                     else:
-                        tdx = dx-1
-
-                # And move into it.
-                game.move_object(x, y, x+tdx, y+tdy)
+                        game.move_object(x, y, x-1, y+dy)
 
         return False
 
 
 class Shooter(Thinker):
     """Slider shooter."""
+    code = SHOOTER
+    __slots__ = ('__round', '__waiting', '__dx', '__dy')
 
     def __init__(self, round):
         """One parameter, boolean - does this shoot round sliders (false -> square)."""
         Thinker.__init__(self)
         self.__round = round
         self.__waiting = 0
+        self.__dx = 0
+        self.__dy = 0
 
     def setang(self, ang):
         """Set the initial angle of this shooter."""
@@ -545,11 +739,13 @@ class Shooter(Thinker):
         elif ang == 3:
             self.__dx = 1
 
+    images = (dirimages("slider_shooter_%s"), dirimages("rocky_shooter_%s"))
+
     def image(self, af):
-        if self.__round:
-            return "rocky_shooter_%s" % direction(self.__dx, self.__dy)
-        else:
-            return "slider_shooter_%s" % direction(self.__dx, self.__dy)
+        return Shooter.images[self.__round][dirindex(self.__dx, self.__dy)]
+
+    def zstate(self):
+        return 2*(9*self.__waiting + zdir(self.__dx, self.__dy)) + self.__round
 
     def think(self, game, x, y):
         dy = -self.__dx
@@ -563,6 +759,7 @@ class Shooter(Thinker):
         if self.__waiting > y and b is None:
             game.add_at(x+dx, y+dy, Slider(dx, dy, self.__round))
             self.__waiting = 0
+        game.rekey(self)
         self.pulltomagnet(game, x, y)
         return True
 
@@ -572,6 +769,8 @@ class Shooter(Thinker):
 
 class BlackHole(Thinker):
     """Represents a black hole."""
+    code = BLACKHOLE
+    __slots__ = ('delay', 'frame')
     delayframes = 4
 
     def __init__(self):
@@ -588,6 +787,7 @@ class BlackHole(Thinker):
             self.frame = 0
         if self.delay > 0:
             self.delay = self.delay - 1
+            game.rekey(self)
         return True
 
     def swallow(self, g, animate=True):
@@ -601,28 +801,43 @@ class BlackHole(Thinker):
             return False
         if animate:
             self.delay = BlackHole.delayframes + 1
+            g.rekey(self)
             g.invalidate_me(self)
         return True
 
+    images = tuple("black_hole_%d" % i for i in range(1, 5))
+    swallow_images = tuple("black_hole_swallow_%d" % i for i in range(delayframes + 1))
+
     def image(self, af):
         if self.delay > 0:
             df = BlackHole.delayframes + 1 - self.delay
             if df <= 0:
                 df = 1
-            return "black_hole_swallow_%s" % df
-        return "black_hole_%s" % (self.frame+1)
+            return BlackHole.swallow_images[df]
+        return BlackHole.images[self.frame]
+
+    def zstate(self):
+        return self.delay
 
 
 class OneWay(Base):
     """Represents a one-way door."""
+    code = ONEWAY
+    __slots__ = ('dx', 'dy')
 
     def __init__(self, dx, dy):
         """Parameters to create a black hole: dx, dy, which define its allowed direction."""
+        Base.__init__(self)
         self.dx = dx
         self.dy = dy
 
+    images = tuple(("oneway_%s_1" % d, "oneway_%s_2" % d) for d in dirmap)
+
     def image(self, af):
-        return "oneway_%s_%s" % (direction(self.dx, self.dy), 1+(af % 2))
+        return OneWay.images[dirindex(self.dx, self.dy)][af % 2]
+
+    def zstate(self):
+        return zdir(self.dx, self.dy)
 
     def allow_move(self, dx, dy):
         """This checks a possible move onto the black hole and returns true if it matches the door's allowed direction."""
@@ -22,7 +22,7 @@ import gi
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, Gdk
 
-from kye.common import XSIZE, YSIZE
+from kye.common import XSIZE
 
 
 class KPalette(Gtk.DrawingArea):
@@ -156,7 +156,9 @@ class KPalette(Gtk.DrawingArea):
 
     def mouse_motion_event(self, x, y):
         """Handle mouse motion event."""
-        if x > XSIZE or y > YSIZE or x < 0 or y < 0:
+        if self.game is None:
+            return
+        if x >= self.game.width or y >= self.game.height or x < 0 or y < 0:
             return
         if self.mousedown is not None:
             if x != self.mousedown[0] or y != self.mousedown[1]:
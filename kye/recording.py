@@ -0,0 +1,670 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""kye.recording - reading and writing recordings of games.
+
+A recording (.kyr) holds the level set file name and level name, what the
+game's random number generator started from, and each move the game got
+each time it asked for the Kye's move. There are three versions.
+
+Version 1 is a gzipped text file. It starts with a header: the line
+"Kye VERSION recording:", the name of the level set file, the name of the
+level, and the pickled state of the random number generator (a
+random.Random). Then there is
+a line for each time the game asked for a move: the move, with its parts
+separated by tabs, or nothing if there was no move.
+
+Version 2 is binary, and may be gzipped, compressed with zstd (if a zstd
+module is available) or not compressed at all. It starts with MAGIC_V2,
+then the level set file name and level name (each a varint length followed
+by UTF-8), then the seed a random.Random was seeded with for the game (a
+zigzag varint). Then come the moves: each is a varint count of the times
+the game asked for a move and got none since the last one, then a byte code
+for the move (see _encode_move). A final count, followed by END, ends the
+recording. Varints are unsigned LEB128; signed numbers are zigzag encoded
+first.
+
+Version 3 is the same as version 2, but starts with MAGIC_V3, and its seed
+is for a KRandom (see kye.rng), whose numbers, unlike those of
+random.Random, are the same in every version of Python.
+
+A version 2 or 3 recording may also hold keyframes: the state of the game (see
+KGame.snapshot) every so many ticks, so that playback can jump to any point
+without playing everything before it. A keyframe goes between moves, as a
+count (as for a move), KEYFRAME, the tick, and the length and bytes of the
+state: the snapshot with each object's class replaced by its name, so that
+it is nothing but plain values, pickled and zlib-compressed. Only plain
+values are unpickled from a recording, and only the classes of game
+objects are looked up by name, so a recording cannot make anything else
+run. After END comes a trailer: the number of
+ticks the game ran, the number of keyframes, and for each its tick and
+position; then the position of the trailer, as 4 bytes, and TRAILER_MAGIC.
+Positions count from just after the magic number.
+
+Only version 3 is written; all are read. Nothing here needs GTK, so
+recordings can be read and played back (see kye.replay) on machines
+without a display."""
+
+import inspect
+import io
+import os.path
+import pickle
+import queue
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from gzip import GzipFile
+from pathlib import Path
+from random import Random
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+try:
+    from compression import zstd  # Python 3.14
+except ImportError:
+    try:
+        import zstandard as zstd  # type: ignore
+    except ImportError:
+        zstd = None
+
+import kye.objects
+from kye.rng import KRandom
+
+Move = Tuple[str, int, int]
+
+MAGIC_V2 = b"KYR\x02"
+MAGIC_V3 = b"KYR\x03"
+TRAILER_MAGIC = b"KYRT"
+_FOOTER = struct.Struct("<I4s")
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Move codes. ("rel", dx, dy), with dx and dy from -1 to 1, is REL +
+# 3*(dy+1) + (dx+1); other moves are ABS or ANY_REL followed by x and y as
+# zigzag varints.
+REL = 0
+ABS = 9
+ANY_REL = 10
+END = 11
+KEYFRAME = 12
+
+# How often the game keeps a keyframe in its recordings, in ticks (once a
+# minute).
+KEYFRAME_TICKS = 600
+
+
+class KDemoError(Exception):
+    pass
+
+
+class KDemoFormatError(KDemoError):
+    pass
+
+
+class KDemoFileMismatch(KDemoError):
+    def __init__(self, filename: Union[Path, str]) -> None:
+        KDemoError.__init__(self)
+        self.filename = filename
+
+
+def _put_varint(out: bytearray, n: int) -> None:
+    while n > 0x7f:
+        out.append(0x80 | (n & 0x7f))
+        n >>= 7
+    out.append(n)
+
+
+def _put_signed(out: bytearray, n: int) -> None:
+    _put_varint(out, 2*n if n >= 0 else -2*n - 1)
+
+
+def _put_string(out: bytearray, s: str) -> None:
+    b = s.encode("utf-8")
+    _put_varint(out, len(b))
+    out += b
+
+
+def _get_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Return the varint at data[pos:], and the position after it."""
+    n = shift = 0
+    while True:
+        try:
+            b = data[pos]
+        except IndexError:
+            raise KDemoFormatError()
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _get_signed(data: bytes, pos: int) -> Tuple[int, int]:
+    n, pos = _get_varint(data, pos)
+    return (n >> 1) ^ -(n & 1), pos
+
+
+def _get_string(data: bytes, pos: int) -> Tuple[str, int]:
+    n, pos = _get_varint(data, pos)
+    if pos + n > len(data):
+        raise KDemoFormatError()
+    return data[pos:pos+n].decode("utf-8"), pos + n
+
+
+def _encode_move(out: bytearray, move: Move) -> None:
+    kind, x, y = move
+    if kind == "rel" and -1 <= x <= 1 and -1 <= y <= 1:
+        out.append(REL + 3*(y+1) + (x+1))
+        return
+    out.append(ABS if kind == "abs" else ANY_REL)
+    _put_signed(out, x)
+    _put_signed(out, y)
+
+
+# The moves for codes REL to REL+8.
+_REL_MOVES = tuple([("rel", x, y) for y in (-1, 0, 1) for x in (-1, 0, 1)])
+
+
+def _decode_move(data: bytes, pos: int) -> Tuple[Optional[Move], int]:
+    """Return the move at data[pos:] (or None for END), and the position after it."""
+    try:
+        code = data[pos]
+    except IndexError:
+        return None, pos  # cut short: take it as the end
+    pos += 1
+    if code < ABS:
+        return _REL_MOVES[code], pos
+    if code == END:
+        return None, pos
+    if code not in (ABS, ANY_REL):
+        raise KDemoFormatError()
+    x, pos = _get_signed(data, pos)
+    y, pos = _get_signed(data, pos)
+    return ("abs" if code == ABS else "rel", x, y), pos
+
+
+class _PlainUnpickler(pickle.Unpickler):
+    """Unpickles plain values only (tuples, numbers, strings, bytes and None), refusing anything that names a class or function."""
+
+    def find_class(self, module: str, name: str) -> Any:
+        raise KDemoFormatError()
+
+
+def _plain_load(f: BinaryIO) -> Any:
+    """Unpickle plain values from f; raises KDemoFormatError if it holds anything else, or is not a pickle."""
+    try:
+        return _PlainUnpickler(f).load()
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError,
+            IndexError, TypeError, ValueError, KeyError) as e:
+        raise KDemoFormatError() from e
+
+
+# The classes of the objects in a keyframe, by name: every concrete game
+# object class, and nothing else.
+_OBJECT_CLASSES = {
+    cls.__name__: cls for cls in vars(kye.objects).values()
+    if isinstance(cls, type) and issubclass(cls, kye.objects.Base)
+    and cls.__module__ == "kye.objects" and not inspect.isabstract(cls)}
+
+_OBJECTS = 3  # where the objects are in a KGame snapshot
+
+
+def _encode_keyframe(snapshot: tuple) -> bytes:
+    """Return the state kept in a keyframe for snapshot (see KGame.snapshot)."""
+    objs = tuple([(cls.__name__, values)
+                  for cls, values in snapshot[_OBJECTS]])
+    state = snapshot[:_OBJECTS] + (objs,) + snapshot[_OBJECTS+1:]
+    return zlib.compress(pickle.dumps(state, 4))
+
+
+def _decode_keyframe(data: bytes) -> tuple:
+    """Return the snapshot kept in a keyframe's state; raises KDemoFormatError if it is not one."""
+    try:
+        state = _plain_load(io.BytesIO(zlib.decompress(data)))
+        objs = tuple([(_OBJECT_CLASSES[name], values)
+                      for name, values in state[_OBJECTS]
+                      if isinstance(values, tuple)])
+        if len(objs) != len(state[_OBJECTS]):
+            raise KDemoFormatError()
+        return state[:_OBJECTS] + (objs,) + state[_OBJECTS+1:]
+    except (zlib.error, KeyError, IndexError, TypeError, ValueError) as e:
+        raise KDemoFormatError() from e
+
+
+def _open_write(raw: BinaryIO, compression: Optional[str]) -> BinaryIO:
+    """Return a stream which compresses what is written to it into raw."""
+    if compression == "gzip":
+        return GzipFile(fileobj=raw, mode="wb")  # type: ignore
+    if compression == "zstd":
+        if zstd is None:
+            raise ValueError("zstd compression is not available")
+        return zstd.open(raw, "wb")
+    if compression is None:
+        return raw
+    raise ValueError("unknown compression %s" % compression)
+
+
+def _open_read(playback: Path) -> BinaryIO:
+    """Open a recording, decompressing it if need be."""
+    f = open(playback, "rb")
+    magic = f.read(4)
+    f.seek(0)
+    if magic.startswith(GZIP_MAGIC):
+        return GzipFile(fileobj=f)  # type: ignore
+    if magic == ZSTD_MAGIC:
+        f.close()
+        if zstd is None:
+            raise KDemoFormatError()
+        return zstd.open(playback, "rb")
+    return f
+
+
+def _read_rest(instream: BinaryIO, limit: int = -1) -> bytes:
+    """Read the rest of a recording (or the next limit bytes of it); if it was cut short in the middle of the compressed data, return what there is."""
+    chunks = []
+    size = 0
+    try:
+        while limit < 0 or size < limit:
+            chunk = instream.read1(65536)  # type: ignore
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+    except EOFError:
+        pass
+    data = b"".join(chunks)
+    return data if limit < 0 else data[:limit]
+
+
+class KRecordWriter:
+    """Writes a recording of a game (in version 3), one move at a time.
+
+    Moves are encoded as they come but written out in batches, by a thread
+    of the writer's own, so the game never waits for the compressor or the
+    disk. A batch is handed over once it reaches FLUSH_BYTES or has been
+    waiting for FLUSH_SECONDS; at most QUEUE_BATCHES wait to be written
+    before the game has to wait too. Every SYNC_SECONDS, and after each
+    keyframe, the thread flushes the compressor and syncs the file to disk,
+    so that if the game dies the recording up to there can still be played
+    back."""
+
+    FLUSH_BYTES = 4096
+    FLUSH_SECONDS = 1.0
+    QUEUE_BATCHES = 64
+    SYNC_SECONDS = 5.0
+
+    def __init__(self, recfile: Path, playfile: Path, playlevel: str,
+                 seed: int, compression: Optional[str] = "gzip",
+                 keyframe_ticks: int = 0) -> None:
+        """Start a recording in recfile of level playlevel from level set playfile, played with a random number generator seeded with seed.
+
+        compression is "gzip", "zstd" or None. If keyframe_ticks is not 0,
+        a keyframe is kept every keyframe_ticks ticks (see tick)."""
+        self.__raw = open(recfile, "wb")
+        try:
+            self.__s = _open_write(self.__raw, compression)
+        except Exception:
+            self.__raw.close()
+            raise
+        header = bytearray()
+        _put_string(header, os.path.basename(playfile))
+        _put_string(header, playlevel)
+        _put_signed(header, seed)
+        self.__idle = 0  # times no move was given since the last move
+        self.__out = header  # encoded but not yet handed to the thread
+        self.__handed = time.monotonic()
+        self.__keyframe_ticks = keyframe_ticks
+        self.__ticks = 0
+
+        # Owned by the writer thread.
+        self.__written = 0  # bytes since MAGIC_V3
+        self.__keyframes: List[Tuple[int, int]] = []  # (tick, position)
+        self.__error: Optional[Exception] = None
+
+        # Each item is a batch of bytes, a keyframe (the count before it,
+        # its tick and the game state), or None for the end.
+        self.__queue: "queue.Queue[Any]" = queue.Queue(self.QUEUE_BATCHES)
+        self.__s.write(MAGIC_V3)
+        self.__thread = threading.Thread(target=self.__run,
+                                         name="recording", daemon=True)
+        self.__thread.start()
+
+    def __hand_over(self) -> None:
+        """Pass the moves encoded so far to the writer thread."""
+        if self.__out:
+            self.__queue.put(bytes(self.__out))
+            self.__out.clear()
+        self.__handed = time.monotonic()
+
+    def write(self, move: Optional[Move]) -> None:
+        """Record the move given to the game when it asked for one."""
+        if move is None:
+            self.__idle += 1
+            return
+        out = self.__out
+        _put_varint(out, self.__idle)
+        _encode_move(out, move)
+        self.__idle = 0
+        if len(out) >= self.FLUSH_BYTES:
+            self.__hand_over()
+
+    def tick(self, game: Any) -> None:
+        """Note that game, the KGame being recorded, has run a tick; keep a keyframe of it if one is due."""
+        self.__ticks = tics = game.tics
+        if self.__keyframe_ticks and tics % self.__keyframe_ticks == 0:
+            # Only the snapshot is taken here; the thread encodes it.
+            self.__hand_over()
+            self.__queue.put((self.__idle, tics, game.snapshot()))
+            self.__idle = 0
+        elif self.__out and time.monotonic() - self.__handed >= self.FLUSH_SECONDS:
+            self.__hand_over()
+
+    def close(self) -> None:
+        """Finish the recording, waiting until it is all written; raises OSError if it could not be."""
+        out = self.__out
+        _put_varint(out, self.__idle)
+        out.append(END)
+        self.__hand_over()
+        self.__queue.put(None)
+        self.__thread.join()
+        if self.__error is not None:
+            raise self.__error
+
+    def __run(self) -> None:
+        """The writer thread: write out what the game hands over, until the end."""
+        synced = time.monotonic()
+        dirty = False
+        while True:
+            try:
+                item = self.__queue.get(timeout=self.SYNC_SECONDS)
+            except queue.Empty:
+                item = ()
+            if self.__error is not None:
+                if item is None:
+                    return
+                continue  # keep draining, so the game is never held up
+            try:
+                if item is None:
+                    self.__finish()
+                    return
+                if isinstance(item, bytes):
+                    self.__write(item)
+                    dirty = True
+                elif item:
+                    self.__write_keyframe(*item)
+                    dirty = True
+                    synced = 0.0  # make sure each keyframe reaches the disk
+                if dirty and time.monotonic() - synced >= self.SYNC_SECONDS:
+                    self.__sync()
+                    synced = time.monotonic()
+                    dirty = False
+            except Exception as e:
+                self.__error = e if isinstance(e, OSError) else OSError(str(e))
+                self.__raw.close()
+
+    def __write(self, data: Union[bytes, bytearray]) -> None:
+        self.__s.write(data)
+        self.__written += len(data)
+
+    def __write_keyframe(self, idle: int, tics: int, snapshot: tuple) -> None:
+        state = _encode_keyframe(snapshot)
+        out = bytearray()
+        _put_varint(out, idle)
+        out.append(KEYFRAME)
+        _put_varint(out, tics)
+        _put_varint(out, len(state))
+        out += state
+        self.__keyframes.append((tics, self.__written))
+        self.__write(out)
+
+    def __sync(self) -> None:
+        """Flush everything written so far through the compressor to the disk."""
+        self.__s.flush()
+        self.__raw.flush()
+        os.fsync(self.__raw.fileno())
+
+    def __finish(self) -> None:
+        """Write the trailer (the END is already written) and close the file."""
+        out = bytearray()
+        _put_varint(out, self.__ticks)
+        _put_varint(out, len(self.__keyframes))
+        for tics, pos in self.__keyframes:
+            _put_varint(out, tics)
+            _put_varint(out, pos)
+        out += _FOOTER.pack(self.__written, TRAILER_MAGIC)
+        self.__s.write(out)
+        if self.__s is not self.__raw:
+            self.__s.close()
+        self.__raw.close()
+
+
+def read_header(playback: Path) -> Tuple[str, str]:
+    """Return the names of the level set file and of the level that a recording is of."""
+    instream = _open_read(playback)
+    try:
+        if instream.read(len(MAGIC_V2)) in (MAGIC_V2, MAGIC_V3):
+            data = _read_rest(instream, 1024)
+            fn, pos = _get_string(data, 0)
+            return fn, _get_string(data, pos)[0]
+        instream.seek(0)
+        return _read_header_v1(instream)
+    finally:
+        instream.close()
+
+
+def _read_header_v1(instream: BinaryIO) -> Tuple[str, str]:
+    header = instream.readline().rstrip().decode()
+    if not (header.startswith("Kye ") and header.endswith(" recording:")):
+        raise KDemoFormatError()
+    fn = instream.readline().rstrip().decode()
+    level = instream.readline().rstrip().decode()
+    return fn, level
+
+
+class KyeRecordedInput:
+    """An input source which is a recording in a file of a previous game.
+
+    The whole recording is read and decoded when it is opened, into an
+    array with a code for each time the game will ask for a move: 0 for no
+    move, or an index into a table of the moves in the recording. Getting a
+    move is then just a step along the array."""
+
+    def __init__(self, playfile: Path, playback: Path) -> None:
+        # Whether a move has been asked for after every move in the
+        # recording has been got.
+        self.overrun = False
+
+        # How many ticks the recorded game ran (0 if not known), and the
+        # tick, position in the file and index in the moves of each
+        # keyframe.
+        self.ticks = 0
+        self.__keyframes: List[Tuple[int, int, int]] = []
+
+        self.__moves: List[Optional[Move]] = [None]
+        self.__codes = array("H")
+        self.__next = 0
+        self.__data = b""
+        instream = _open_read(playback)
+        try:
+            magic = instream.read(len(MAGIC_V2))
+            if magic in (MAGIC_V2, MAGIC_V3):
+                self.version = 2 if magic == MAGIC_V2 else 3
+                self.__data = data = _read_rest(instream)
+                fn, pos = _get_string(data, 0)
+                self.__level, pos = _get_string(data, pos)
+                self.__seed, pos = _get_signed(data, pos)
+                self.__decode(pos)
+                self.__read_trailer()
+            else:
+                self.version = 1
+                instream.seek(0)
+                fn, self.__level = _read_header_v1(instream)
+                self.__rng: Tuple[Any, ...] = _plain_load(instream)
+                self.__decode_v1(_read_rest(instream))
+        finally:
+            instream.close()
+        self.ended = len(self.__codes) == 0
+
+        # Check filename in the demo is what we have loaded.
+        if fn != os.path.basename(playfile):
+            raise KDemoFileMismatch(fn)
+
+    def get_level(self) -> str:
+        """Return the level name for this recording."""
+        return self.__level
+
+    def make_rng(self) -> Union[Random, KRandom]:
+        """Return a random number generator in the state the recorded game's started in."""
+        if self.version == 1:
+            rng = Random()
+            rng.setstate(self.__rng)
+            return rng
+        if self.version == 2:
+            return Random(self.__seed)
+        return KRandom(self.__seed)
+
+    def get_move(self) -> Optional[Move]:
+        """Get a move from the recording."""
+        i = self.__next
+        codes = self.__codes
+        if i < len(codes):
+            self.__next = i = i + 1
+            self.ended = i == len(codes)
+            return self.__moves[codes[i-1]]
+        self.overrun = True
+        return None
+
+    def __code(self, move: Move, codes: Dict[Move, int]) -> int:
+        """Return the code for move, adding it to the table of moves if it is new."""
+        code = codes.get(move)
+        if code is None:
+            code = codes[move] = len(self.__moves)
+            self.__moves.append(move)
+            if code > 0xffff and self.__codes.typecode == "H":
+                self.__codes = array("L", self.__codes)
+        return code
+
+    def __decode_v1(self, data: bytes) -> None:
+        """Decode the moves of a version 1 recording, one per line."""
+        lines = data.split(b"\n")
+        if lines[-1] == b"":
+            lines.pop()
+        table: Dict[bytes, int] = {b"": 0}
+        codes: Dict[Move, int] = {}
+        out = []
+        for line in lines:
+            line = line.rstrip()
+            code = table.get(line)
+            if code is None:
+                s = line.decode().split("\t")
+                code = table[line] = self.__code((s[0], int(s[1]), int(s[2])), codes)
+            out.append(code)
+        self.__codes = array(self.__codes.typecode, out)
+
+    def __decode(self, pos: int) -> None:
+        """Decode the moves of a version 2 or 3 recording, from data[pos:] to the END.
+
+        If the recording was cut short, it ends at the last whole move."""
+        data = self.__data
+        out = self.__codes
+        codes: Dict[Move, int] = {}
+        for rel in _REL_MOVES:
+            self.__code(rel, codes)
+        zeros = bytes(out.itemsize)
+        try:
+            while pos < len(data):
+                start = pos
+                n, pos = _get_varint(data, pos)
+                if pos >= len(data):
+                    break
+                code = data[pos]
+                if code == END:
+                    out.frombytes(zeros * n)
+                    break
+                if code == KEYFRAME:
+                    tics = _get_varint(data, pos + 1)[0]
+                    pos = self.__skip_keyframe(pos)[1]
+                    out.frombytes(zeros * n)
+                    self.__keyframes.append((tics, start, len(out)))
+                    self.ticks = tics
+                    continue
+                if code < ABS:
+                    pos += 1
+                    code += 1
+                else:
+                    move, pos = _decode_move(data, pos)
+                    if move is None:
+                        break
+                    code = self.__code(move, codes)
+                    if self.__codes is not out:  # widened to hold code
+                        out = self.__codes
+                        zeros = bytes(out.itemsize)
+                out.frombytes(zeros * n)
+                out.append(code)
+        except KDemoFormatError:
+            pass  # cut short in the middle of something: that is the end
+
+    def __skip_keyframe(self, pos: int) -> Tuple[int, int]:
+        """Return the start and end of the state in the keyframe at pos, just after its count."""
+        data = self.__data
+        tics, pos = _get_varint(data, pos + 1)
+        size, pos = _get_varint(data, pos)
+        if pos + size > len(data):
+            raise KDemoFormatError()
+        return pos, pos + size
+
+    def __read_trailer(self) -> None:
+        """Read how many ticks the game ran from the trailer, if the recording was not cut short before it.
+
+        The keyframes are all found while decoding, so the index of them in
+        the trailer is not needed here."""
+        data = self.__data
+        if len(data) >= _FOOTER.size:
+            start, magic = _FOOTER.unpack_from(data, len(data) - _FOOTER.size)
+            if magic == TRAILER_MAGIC and start < len(data):
+                try:
+                    self.ticks = _get_varint(data, start)[0]
+                except KDemoFormatError:
+                    pass
+
+    def seek(self, tick: int) -> Optional[tuple]:
+        """Go to the last keyframe at or before tick, and return the state of the game kept there (see KGame.snapshot); or, if there is none, go back to the start and return None.
+
+        Moves are then got from that point. Version 1 recordings cannot
+        be sought in."""
+        if self.version == 1:
+            raise KDemoError("version 1 recordings cannot be sought in")
+        i = bisect_right(self.__keyframes, (tick, len(self.__data), 0))
+        self.overrun = False
+        if i == 0:
+            self.__next = 0
+            self.ended = len(self.__codes) == 0
+            return None
+        tics, kpos, self.__next = self.__keyframes[i-1]
+        self.ended = self.__next == len(self.__codes)
+        pos = _get_varint(self.__data, kpos)[1]
+        start, end = self.__skip_keyframe(pos)
+        return _decode_keyframe(self.__data[start:end])
+
+    def close(self) -> None:
+        """Let go of the recording, which is no longer needed."""
+        self.__data = b""
+        self.__codes = array(self.__codes.typecode)
+        self.__keyframes = []
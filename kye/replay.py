@@ -0,0 +1,347 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""kye.replay - plays recordings back without a display, as fast as the game can run.
+
+This is for checking recordings: each is played against the level set it
+was made in, and what happened is reported as JSON. Nothing here needs
+GTK.
+
+Many recordings can be checked at once (see verify): they are grouped by
+level set and shared out between worker processes, each of which keeps the
+level sets it has loaded. The results can be kept in a database (see
+KResultsDB), so that checking the same recordings again only plays the ones
+which have changed, or whose level set or game engine has changed."""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from gzip import BadGzipFile
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from kye.common import findfile
+from kye.game import KGame, KGameFormatError
+from kye.levelset import KLevelSet
+from kye.recording import KDemoError, KDemoFileMismatch, KDemoFormatError, KyeRecordedInput, read_header
+import kye.game
+import kye.levelset
+import kye.objects
+import kye.recording
+import kye.rng
+import kye.scheduler
+
+# Recordings are given up on after this many ticks (about 28 hours of play).
+MAX_TICKS = 1000000
+
+# The modules whose code decides how a recording plays back.
+ENGINE = (kye.game, kye.levelset, kye.objects, kye.recording, kye.rng,
+          kye.scheduler, sys.modules[__name__])
+
+# A result of playing back a recording: see replay(), plus "recording",
+# "levelfile", "seconds" (the time taken) and, if it could not be played,
+# "error".
+Result = Dict[str, Any]
+
+
+def find_levelset(playback: Path, name: str) -> Path:
+    """Return where the level set file called name is, for recording playback.
+
+    It is looked for next to the recording, then wherever the game looks."""
+    here = playback.parent / name
+    if here.exists():
+        return here
+    return findfile(name)
+
+
+def replay(playback: Path, levels: KLevelSet,
+           max_ticks: int = MAX_TICKS) -> Dict[str, Any]:
+    """Play the recording playback of a game in levels, and return how the game ended.
+
+    The game runs until the level is completed, the Kye has no lives left,
+    the game is about to need a move after the last one in the recording,
+    or max_ticks ticks have passed. The result gives the level, whether it
+    was completed, the Kye's lives left (-1 once they have all gone), the
+    number of ticks run and the state hash at the end (see
+    KGame.state_hash), in hex."""
+    source = KyeRecordedInput(levels.path, playback)
+    try:
+        rng = source.make_rng()
+        game = KGame(levels, want_level=source.get_level(), movesource=source,
+                     rng=rng, hashing=True)
+        kye = game.kye
+        assert kye is not None  # every level starts with one
+        while game.diamonds > 0 and kye.lives >= 0 and game.tics < max_ticks:
+            if source.ended:
+                # The game can go on for a while without asking for moves
+                # (while the Kye is dying, say); the tick in which it asks
+                # for one more was not part of the game, so is undone.
+                state = game.snapshot()
+                game.dotick()
+                if source.overrun:
+                    game.restore(state)
+                    break
+            else:
+                game.dotick()
+    finally:
+        source.close()
+    return {"level": game.thislev,
+            "completed": game.diamonds == 0,
+            "lives": kye.lives,
+            "ticks": game.tics,
+            "hash": "%016x" % game.state_hash()}
+
+
+def engine_id() -> str:
+    """Return a hash of the code of the game engine, which changes whenever the engine does."""
+    h = hashlib.sha1()
+    for module in ENGINE:
+        assert module.__file__ is not None  # for mypy
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def find_recordings(paths: Iterable[Path]) -> List[Path]:
+    """Return the recordings given by paths, looking through any directories for .kyr files."""
+    found = []
+    for path in paths:
+        if path.is_dir():
+            found.extend(sorted(path.rglob("*.kyr")))
+        else:
+            found.append(path)
+    return found
+
+
+def _stamp(path: Path) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class KResultsDB:
+    """A database of the results of playing back recordings.
+
+    A result is kept along with the size and modification time of the
+    recording and of its level set, and the engine_id of the game that
+    played it; it is only given back while all of those are unchanged.
+    Results for recordings which could not be played are not kept."""
+
+    FIELDS = ("levelfile", "level", "completed", "lives", "ticks", "hash",
+              "seconds")
+
+    def __init__(self, path: Path) -> None:
+        self.__db = sqlite3.connect(path)
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS results (
+            recording TEXT PRIMARY KEY, size INTEGER, mtime INTEGER,
+            levelsize INTEGER, levelmtime INTEGER, engine TEXT,
+            levelfile TEXT, level TEXT, completed INTEGER, lives INTEGER,
+            ticks INTEGER, hash TEXT, seconds REAL)""")
+        self.__engine = engine_id()
+
+    def get(self, playback: Path,
+            levelfile: Optional[Path] = None) -> Optional[Result]:
+        """Return the result kept for recording playback, if it is still good; levelfile, if given, is the level set it must be for."""
+        row = self.__db.execute(
+            "SELECT size, mtime, levelsize, levelmtime, engine, %s "
+            "FROM results WHERE recording = ?" % ", ".join(KResultsDB.FIELDS),
+            (str(playback.resolve()),)).fetchone()
+        if row is None:
+            return None
+        result: Result = dict(zip(KResultsDB.FIELDS, row[5:]))
+        result["completed"] = bool(result["completed"])
+        try:
+            if (row[4] != self.__engine
+                    or row[:2] != _stamp(playback)
+                    or row[2:4] != _stamp(Path(result["levelfile"]))
+                    or (levelfile is not None
+                        and Path(result["levelfile"]) != levelfile.resolve())):
+                return None
+        except OSError:
+            return None
+        result["recording"] = str(playback)
+        return result
+
+    def put(self, result: Result) -> None:
+        """Keep a result from verify()."""
+        if "error" in result:
+            return
+        playback = Path(result["recording"])
+        levelfile = Path(result["levelfile"])
+        self.__db.execute(
+            "INSERT OR REPLACE INTO results VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(playback.resolve()),) + _stamp(playback) + _stamp(levelfile)
+            + (self.__engine, str(levelfile.resolve()))
+            + tuple([result[f] for f in KResultsDB.FIELDS[1:]]))
+
+    def commit(self) -> None:
+        self.__db.commit()
+
+    def close(self) -> None:
+        self.__db.commit()
+        self.__db.close()
+
+
+# The level sets loaded by this process, by path, kept between batches so
+# that each level is only loaded once (see KLevelSet.templates).
+_levelsets: Dict[Path, KLevelSet] = {}
+
+
+def _error(playback: Path, e: Exception) -> Result:
+    """Return the result for a recording which could not be played because of e."""
+    if isinstance(e, KDemoFileMismatch):
+        error = "recording is for %s" % e.filename
+    elif isinstance(e, (KDemoFormatError, BadGzipFile, EOFError,
+                        pickle.UnpicklingError, UnicodeDecodeError)):
+        error = "not a Kye recording"
+    elif isinstance(e, KGameFormatError):
+        error = "not a valid Kye level file"
+    elif isinstance(e, KeyError):
+        error = str(e.args[0])
+    elif isinstance(e, (ValueError, IndexError)):
+        error = "bad move in recording"
+    else:
+        error = str(e) or "file not found"
+    return {"recording": str(playback), "error": error}
+
+
+# The errors which stop a recording being played.
+_ERRORS = (KDemoError, KGameFormatError, OSError, EOFError,
+           pickle.UnpicklingError, ValueError, IndexError, KeyError)
+
+
+def _replay_batch(levelfile: Path, recordings: List[Path],
+                  max_ticks: int) -> List[Result]:
+    """Play back recordings, all of level set levelfile."""
+    results: List[Result] = []
+    for playback in recordings:
+        start = time.perf_counter()
+        try:
+            levels = _levelsets.get(levelfile)
+            if levels is None:
+                levels = _levelsets[levelfile] = KLevelSet(levelfile)
+            result: Result = {"recording": str(playback),
+                              "levelfile": str(levelfile)}
+            result.update(replay(playback, levels, max_ticks))
+        except _ERRORS as e:
+            result = _error(playback, e)
+        result["seconds"] = round(time.perf_counter() - start, 6)
+        results.append(result)
+    return results
+
+
+def verify(recordings: Sequence[Path], levelfile: Optional[Path] = None,
+           jobs: int = 1, max_ticks: int = MAX_TICKS,
+           db: Optional[KResultsDB] = None,
+           batch: int = 16) -> Iterator[Result]:
+    """Play back recordings, and yield the result for each, in no particular order.
+
+    Each recording is played against levelfile, if given, or else against
+    the level set named in it (see find_levelset). Recordings are played in
+    batches of up to batch, all of one level set, shared out between jobs
+    worker processes (or played in this process, if jobs is 1). Results
+    kept in db are used where they are still good, and marked "cached";
+    new results are added to it."""
+    groups: Dict[Path, List[Path]] = {}
+    for playback in recordings:
+        if db is not None:
+            result = db.get(playback, levelfile)
+            if result is not None:
+                result["cached"] = True
+                yield result
+                continue
+        path = levelfile
+        if path is None:
+            try:
+                name = read_header(playback)[0]
+                try:
+                    path = find_levelset(playback, name)
+                except FileNotFoundError:
+                    yield {"recording": str(playback),
+                           "error": "level set %s not found" % name}
+                    continue
+            except _ERRORS as e:
+                yield _error(playback, e)
+                continue
+        groups.setdefault(path, []).append(playback)
+
+    work = [(path, group[i:i+batch]) for path, group in groups.items()
+            for i in range(0, len(group), batch)]
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            futures: List[Future] = [
+                pool.submit(_replay_batch, path, part, max_ticks)
+                for path, part in work]
+            for future in futures:
+                yield from _record(db, future.result())
+    else:
+        for path, part in work:
+            yield from _record(db, _replay_batch(path, part, max_ticks))
+
+
+def _record(db: Optional[KResultsDB], results: List[Result]) -> List[Result]:
+    if db is not None:
+        for result in results:
+            db.put(result)
+        db.commit()
+    return results
+
+
+def main(argv: Sequence[str]) -> int:
+    """Play back recordings as the command line asks; returns the exit status."""
+    parser = argparse.ArgumentParser(
+        prog="Kye-replay",
+        description="Play Kye recordings back without a display, and report "
+                    "how each game ended as a line of JSON.")
+    parser.add_argument("recordings", nargs="+", type=Path,
+                        help="the recordings (.kyr) to play, or directories "
+                             "to look for them in")
+    parser.add_argument("-l", "--levels", type=Path,
+                        help="the level set the recordings are of (default: "
+                             "the one named in each recording)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes")
+    parser.add_argument("--db", type=Path,
+                        help="database of results, used to skip recordings "
+                             "which have not changed since they were last played")
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS,
+                        help="stop each game after this many ticks")
+    args = parser.parse_args(argv)
+
+    db = None if args.db is None else KResultsDB(args.db)
+    failed = 0
+    try:
+        for result in verify(find_recordings(args.recordings), args.levels,
+                             args.jobs, args.max_ticks, db):
+            if not result.get("completed"):
+                failed += 1
+            print(json.dumps(result), flush=True)
+    finally:
+        if db is not None:
+            db.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
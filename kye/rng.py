@@ -0,0 +1,77 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""kye.rng - contains the KRandom class, the random number generator for games."""
+
+import struct
+from hashlib import blake2b
+from typing import Tuple
+
+_BLOCK = struct.Struct("<16I")
+
+
+class KRandom:
+    """A fast random number generator, whose numbers depend only on its seed, and not on the version of Python.
+
+    The numbers come in blocks of 16 32-bit numbers, each block being the
+    BLAKE2b hash of its number, keyed with the seed; so the state is just
+    the seed and how many numbers have been used, and any point in the
+    sequence can be got back to at once. It has the parts of the interface
+    of random.Random which KGame uses, so either can be a game's random
+    number source: recordings made before this was added replay with
+    random.Random (see kye.recording)."""
+
+    __slots__ = ("__key", "__block", "__values", "__next")
+
+    def __init__(self, seed: int = 0) -> None:
+        self.seed(seed)
+
+    def seed(self, seed: int) -> None:
+        """Start the sequence for seed, which may be any integer (it is taken modulo 2**64)."""
+        self.__key = (seed & 0xffffffffffffffff).to_bytes(8, "little")
+        self.__block = 0
+        self.__values: Tuple[int, ...] = ()
+        self.__next = 16
+
+    def randint(self, a: int, b: int) -> int:
+        """Return a random integer from a to b inclusive."""
+        i = self.__next
+        if i == 16:
+            self.__values = _BLOCK.unpack(blake2b(
+                self.__block.to_bytes(8, "little"), key=self.__key).digest())
+            self.__block += 1
+            i = 0
+        self.__next = i + 1
+        return a + ((self.__values[i] * (b - a + 1)) >> 32)
+
+    def getstate(self) -> Tuple[int, int]:
+        """Return the state of the generator, for setstate(): the seed and how many numbers have been used.
+
+        It is made of integers only, so that KGame.state_hash can fold it
+        into a hash which is the same on every machine."""
+        return (int.from_bytes(self.__key, "little"),
+                16*self.__block + self.__next - 16)
+
+    def setstate(self, state: Tuple[int, int]) -> None:
+        """Put the generator back to a state returned by getstate()."""
+        seed, used = state
+        self.seed(seed)
+        self.__block, n = divmod(used, 16)
+        if n:
+            self.randint(0, 0)
+            self.__next = n
@@ -0,0 +1,273 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""kye.scheduler - keeps track of which game objects think on which tick."""
+
+from bisect import bisect_left, bisect_right
+from heapq import heapify, heappop, heappush, heapreplace
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import kye.objects
+
+
+class ThinkerBucket:
+    """All the active objects which think at one particular frequency, and which started in one particular chunk of the board.
+
+    Objects are held in the order they were added, each with a sequence number
+    that orders it against objects in other buckets. Removed objects leave a
+    None behind, which is cleared out by compact() when nobody is iterating
+    over the bucket."""
+
+    def __init__(self, freq: int) -> None:
+        self.freq = freq
+        self.index = 0  # position in the scheduler's list of buckets
+        self.seqs: List[int] = []
+        self.objs: List[Optional[kye.objects.Base]] = []
+        self.dead = 0
+        self.awake = 0  # number of objects here which are not asleep
+
+        # The last tick this bucket was part of, and the position and end
+        # of the current pass over it, in due().
+        self.tick = 0
+        self.cursor = 0
+        self.end = 0
+
+    def compact(self) -> None:
+        """Drop the entries of removed objects, and renumber the survivors."""
+        seqs: List[int] = []
+        objs: List[Optional[kye.objects.Base]] = []
+        for seq, obj in zip(self.seqs, self.objs):
+            if obj is not None:
+                obj.sched_index = len(objs)
+                seqs.append(seq)
+                objs.append(obj)
+        self.seqs = seqs
+        self.objs = objs
+        self.dead = 0
+
+
+class KScheduler:
+    """The set of active objects in a game, bucketed by their think frequency and by the chunk of the board they started in.
+
+    Adding and removing objects is O(1), and both are safe while a tick is
+    being run: objects added during a tick first think on a later tick, and
+    objects removed during a tick do not think again. Within a tick, objects
+    think in the order that they were added to the game, whatever their
+    frequency or chunk, just as with a single list of all the active objects.
+
+    Objects can also be marked as asleep (see KGame.dotick); buckets with
+    nothing awake in them are skipped entirely."""
+
+    # Above this many buckets due in one tick, merge them using a heap.
+    MAXSCAN = 5
+
+    def __init__(self) -> None:
+        self.__buckets: Dict[Tuple[int, int], ThinkerBucket] = {}
+        self.__bucketlist: List[ThinkerBucket] = []  # by obj.sched_bucket
+        self.__byfreq: List[Tuple[int, List[ThinkerBucket]]] = []
+        self.__due: List[ThinkerBucket] = []
+        self.__late: List[ThinkerBucket] = []
+        self.__heap: List[Tuple[int, int]] = []
+        self.__seq = 0
+        self.__tics = 0
+        self.__iterating = 0
+
+    def __len__(self) -> int:
+        return sum(len(b.objs) - b.dead for b in self.__buckets.values())
+
+    def add(self, f: int, obj: kye.objects.Base, chunk: int = 0) -> None:
+        """Add obj, which thinks every f ticks and is in the given chunk of the board."""
+        b = self.__buckets.get((f, chunk))
+        if b is None:
+            b = self.__new_bucket(f, chunk)
+        self.__seq += 1
+        obj.sched_bucket = b.index
+        obj.sched_index = len(b.objs)
+        b.seqs.append(self.__seq)
+        b.objs.append(obj)
+        b.awake += 1
+
+    def __new_bucket(self, f: int, chunk: int) -> ThinkerBucket:
+        b = self.__buckets[(f, chunk)] = ThinkerBucket(f)
+        b.index = len(self.__bucketlist)
+        self.__bucketlist.append(b)
+        for freq, bs in self.__byfreq:
+            if freq == f:
+                bs.append(b)
+                break
+        else:
+            self.__byfreq.append((f, [b]))
+        return b
+
+    def remove(self, obj: kye.objects.Base) -> None:
+        """Remove obj, which must be awake."""
+        b = self.__bucketlist[obj.sched_bucket]
+        b.objs[obj.sched_index] = None
+        b.dead += 1
+        b.awake -= 1
+        if not self.__iterating and b.dead > 16 and 2*b.dead > len(b.objs):
+            b.compact()
+
+    def sleep(self, obj: kye.objects.Base) -> None:
+        """Record that obj has gone to sleep."""
+        self.__bucketlist[obj.sched_bucket].awake -= 1
+
+    def wake(self, obj: kye.objects.Base) -> None:
+        """Record that obj has woken up."""
+        b = self.__bucketlist[obj.sched_bucket]
+        b.awake += 1
+
+        # If this bucket was passed over by the tick being run because
+        # everything in it was asleep, it must join the tick now. (It may
+        # have something awake already: an object added during the tick,
+        # which waits for the next one.)
+        if (self.__iterating and b.tick != self.__tics
+                and self.__tics % b.freq == 0):
+            b.tick = self.__tics
+            self.__late.append(b)
+
+    def save(self, index: Callable[[kye.objects.Base], int]) -> tuple:
+        """Return what the scheduler holds, with each object replaced by index(object), for load() to put back."""
+        buckets = []
+        for (f, chunk), b in self.__buckets.items():
+            live = [(seq, obj) for seq, obj in zip(b.seqs, b.objs)
+                    if obj is not None]
+            buckets.append((f, chunk, tuple([seq for seq, obj in live]),
+                            tuple([index(obj) for seq, obj in live])))
+        return self.__seq, tuple(buckets)
+
+    def load(self, saved: tuple, objects: Sequence[kye.objects.Base]) -> None:
+        """Fill an empty scheduler with what save() returned; objects gives the object for each index.
+
+        All the objects are awake afterwards."""
+        self.__seq, buckets = saved
+        for f, chunk, seqs, indices in buckets:
+            b = self.__new_bucket(f, chunk)
+            b.seqs = list(seqs)
+            b.objs = objs = [objects[i] for i in indices]
+            b.awake = len(objs)
+            for i, obj in enumerate(objs):
+                obj.sched_bucket = b.index
+                obj.sched_index = i
+
+    def due(self, tics: int) -> Iterator[kye.objects.Base]:
+        """Yield, in order, every object which should think on tick tics.
+
+        Objects in a bucket with anything awake are yielded even if they are
+        asleep themselves; the caller checks for that. This runs every tick,
+        so for the usual handful of buckets it allocates nothing beyond the
+        generator itself. It must not be re-entered while iterating."""
+        runs = self.__due
+        runs.clear()
+        late = self.__late
+        late.clear()
+        self.__tics = tics
+        limit = self.__seq  # objects added after this wait for the next tick
+        for f, bs in self.__byfreq:
+            if tics % f == 0:
+                for b in bs:
+                    if b.awake > 0:
+                        b.tick = tics
+                        b.cursor = 0
+                        b.end = len(b.objs)
+                        runs.append(b)
+        if not runs:
+            return
+        self.__iterating += 1
+        try:
+            # Interleave the due buckets back into the order of addition.
+            # Walk the biggest bucket directly, slotting the (usually far
+            # fewer) objects from the others in by sequence number.
+            big = runs[0]
+            for b in runs:
+                if b.end > big.end:
+                    big = b
+            seqs, objs = big.seqs, big.objs
+            n = big.end
+            i = 0
+            lastseq = 0
+
+            # With many buckets due (large boards), keep the others in a heap
+            # by their next sequence number, rather than scanning them.
+            heap = self.__heap
+            heap.clear()
+            scan = True
+
+            while True:
+                # Buckets woken during the tick join it from where we are now.
+                if late:
+                    for b in late:
+                        b.cursor = bisect_right(b.seqs, lastseq)
+                        b.end = bisect_right(b.seqs, limit)
+                        runs.append(b)
+                        if not scan and b.cursor < b.end:
+                            heappush(heap, (b.seqs[b.cursor], len(runs) - 1))
+                    late.clear()
+                if scan and len(runs) > KScheduler.MAXSCAN:
+                    scan = False
+                    for j in range(len(runs)):
+                        b = runs[j]
+                        if b is not big and b.cursor < b.end:
+                            heap.append((b.seqs[b.cursor], j))
+                    heapify(heap)
+
+                # Find the earliest pending object in the other buckets.
+                nb = None
+                nseq = 0
+                if scan:
+                    for b in runs:
+                        if b is not big and b.cursor < b.end:
+                            seq = b.seqs[b.cursor]
+                            if nb is None or seq < nseq:
+                                nb = b
+                                nseq = seq
+                elif heap:
+                    nseq, j = heap[0]
+                    nb = runs[j]
+
+                # Everything before it in the big bucket goes first.
+                k = n if nb is None else bisect_left(seqs, nseq, i, n)
+                while i < k:
+                    obj = objs[i]
+                    i += 1
+                    if obj is not None:
+                        yield obj
+                        if late:
+                            break
+                if late:
+                    lastseq = seqs[i - 1]
+                    continue
+                if nb is None:
+                    break
+
+                obj = nb.objs[nb.cursor]
+                lastseq = nseq
+                nb.cursor += 1
+                if not scan:
+                    if nb.cursor < nb.end:
+                        heapreplace(heap, (nb.seqs[nb.cursor], j))
+                    else:
+                        heappop(heap)
+                if obj is not None:
+                    yield obj
+        finally:
+            self.__iterating -= 1
+            if not self.__iterating:
+                for b in runs:
+                    if b.dead > 16 and 2*b.dead > len(b.objs):
+                        b.compact()
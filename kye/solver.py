@@ -0,0 +1,384 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""kye.solver - searches for a way to complete a level, and writes it out as a recording.
+
+The search is best-first over game states: each state is a KGame snapshot,
+and its successors are the states one tick later for each of the Kye's nine
+possible moves (the eight directions, or staying still). States are told
+apart by KGame.state_hash, so each is only visited once (unless it has been
+dropped to save memory: see KSolver). The game's random
+number generator is seeded with a fixed seed, which is saved in the
+recording, so that the game replays exactly as it was searched.
+
+States are expanded in small batches by a pool of worker processes, each
+with its own copy of the game."""
+
+import argparse
+import os
+import sys
+from collections import deque
+from heapq import heapify, heappop, heappush, nsmallest
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from kye.game import KGame
+from kye.levelset import KLevelSet
+from kye.objects import DIAMOND, EMPTY, WALL
+from kye.recording import KRecordWriter, Move
+from kye.rng import KRandom
+
+# The moves tried from each state. None is staying still.
+MOVES: Tuple[Optional[Move], ...] = (
+    None,
+    ("rel", -1, 0), ("rel", 1, 0), ("rel", 0, -1), ("rel", 0, 1),
+    ("rel", -1, -1), ("rel", 1, -1), ("rel", -1, 1), ("rel", 1, 1))
+
+# A successor state: the index in MOVES of the move taken to reach it (or -1
+# if the game did not ask for a move on that tick), its state hash, its
+# estimated distance from a solution, whether it completes the level, and
+# its snapshot.
+Child = Tuple[int, int, int, bool, tuple]
+
+
+class _Plan:
+    """Move source for a game being searched: always gives the move it was last set to."""
+
+    def __init__(self) -> None:
+        self.move: Optional[Move] = None
+        self.asked = False
+
+    def get_move(self) -> Optional[Move]:
+        self.asked = True
+        return self.move
+
+
+class KExpander:
+    """Works out the successors of game states, for one level."""
+
+    def __init__(self, path: Path, level: str, seed: int) -> None:
+        self.plan = _Plan()
+        levels = KLevelSet(path)
+        self.game = KGame(levels, want_level=level, movesource=self.plan,
+                          rng=KRandom(seed), hashing=True)
+        levels.close()
+
+        # Hashes of the states this expander has already produced; the
+        # search ignores them anyway, so they need not be sent back.
+        self.__seen: set = set()
+
+        # Diamonds and walls never move, so the distance from each square
+        # to each diamond, going round walls, is worked out just once.
+        game = self.game
+        self.__diamonds = []
+        pos = game.cells.find(DIAMOND)
+        while pos >= 0:
+            self.__diamonds.append((pos, self.__distances(pos)))
+            pos = game.cells.find(DIAMOND, pos + 1)
+
+    def __distances(self, start: int) -> List[int]:
+        """Return the number of moves from each square to board index start, avoiding walls."""
+        game = self.game
+        cells = game.cells
+        stride = game.stride
+        steps = (-stride-1, -stride, -stride+1, -1, 1, stride-1, stride, stride+1)
+        far = len(cells)
+        dist = [far] * len(cells)
+        dist[start] = 0
+        queue = deque([start])
+        while queue:
+            pos = queue.popleft()
+            d = dist[pos] + 1
+            for step in steps:
+                p = pos + step
+                if cells[p] != WALL and dist[p] > d:
+                    dist[p] = d
+                    queue.append(p)
+        return dist
+
+    def distance(self) -> int:
+        """Estimate how far the game is from completing the level.
+
+        This counts ten for each diamond left, plus the number of moves the
+        Kye needs to get to the nearest diamond, going round walls but not
+        anything else."""
+        game = self.game
+        kye = game.kye
+        assert kye is not None  # for mypy
+        cells = game.cells
+        kpos = game.stride*kye.y + kye.x + game.origin
+        nearest = min([dist[kpos] for pos, dist in self.__diamonds
+                       if cells[pos] == DIAMOND], default=0)
+        return 10*game.diamonds + nearest
+
+    def moves(self) -> List[int]:
+        """Return the indices in MOVES of the moves worth trying in the game's present state.
+
+        Moves the game would refuse (into a wall, or diagonally past
+        something) have the same outcome as staying still, so are left out."""
+        game = self.game
+        kye = game.kye
+        assert kye is not None  # for mypy
+        cells = game.cells
+        stride = game.stride
+        pos = stride*kye.y + kye.x + game.origin
+        useful = [0]
+        for i in range(1, len(MOVES)):
+            move = MOVES[i]
+            assert move is not None  # for mypy
+            dx, dy = move[1:]
+            if cells[pos + stride*dy + dx] == WALL:
+                continue
+            if dx and dy and (cells[pos + dx] != EMPTY or cells[pos + stride*dy] != EMPTY):
+                continue
+            useful.append(i)
+        return useful
+
+    def expand(self, state: tuple) -> List[Child]:
+        """Return the successors of state, a snapshot of the game.
+
+        States where the Kye has died are left out, as are any already
+        produced by this expander."""
+        game = self.game
+        plan = self.plan
+        seen = self.__seen
+        children: List[Child] = []
+        game.restore(state)
+        moves = self.moves() if game.kye is not None else [0]
+        for n, i in enumerate(moves):
+            if n:
+                game.restore(state)
+            plan.move = MOVES[i]
+            plan.asked = False
+            game.dotick()
+            if game.kye is None:
+                continue
+            h = game.state_hash()
+            if h in seen:
+                continue
+            seen.add(h)
+            won = game.diamonds == 0
+            children.append((i if plan.asked else -1, h,
+                             0 if won else self.distance(), won,
+                             game.snapshot()))
+        return children
+
+
+# The expander of a worker process.
+_expander: Optional[KExpander] = None
+
+
+def _start_worker(path: Path, level: str, seed: int) -> None:
+    global _expander
+    _expander = KExpander(path, level, seed)
+
+
+def _expand_all(states: List[tuple]) -> List[List[Child]]:
+    assert _expander is not None
+    return [_expander.expand(s) for s in states]
+
+
+class KSolver:
+    """Searches for a sequence of moves which completes a level.
+
+    States are taken from the most promising in batches of batch, which
+    are shared out between jobs worker processes (or done in this process,
+    if jobs is 1): each worker is given batch/jobs states at a time, and
+    is given more as soon as it is done, so that with more workers the
+    search goes faster but takes states in much the same order. At most
+    max_states states are expanded. To bound memory use, whenever more than
+    max_frontier states are waiting to be expanded the less promising half
+    of them are dropped, along with the parts of the search tree which led
+    only to them; so a dropped state may be come to again. The search is
+    greedy in proportion to weight: the higher it is, the more it favours
+    states which look close to a solution over ones reached in fewer moves."""
+
+    def __init__(self, path: Path, level: str, seed: int = 0, jobs: int = 1,
+                 max_states: int = 200000, max_frontier: int = 20000,
+                 weight: int = 3, batch: int = 64) -> None:
+        self.path = path
+        self.level = level
+        self.seed = seed
+        self.jobs = jobs
+        self.max_states = max_states
+        self.max_frontier = max_frontier
+        self.weight = weight
+        self.batch = batch
+        self.expanded = 0  # states expanded by the last solve()
+
+    def solve(self) -> Optional[List[Optional[Move]]]:
+        """Return the moves which complete the level, in the order the game asks for them, or None if no way was found."""
+        _start_worker(self.path, self.level, self.seed)
+        assert _expander is not None
+        root = _expander.game
+        if root.diamonds == 0:
+            return []
+
+        # The search tree: for each state seen, the state it was reached
+        # from and the move which got there.
+        start = root.state_hash()
+        parents: Dict[int, Tuple[int, int]] = {start: (start, -1)}
+        states = {start: root.snapshot()}
+        frontier: List[Tuple[int, int, int]] = [(0, 0, start)]
+        depth = {start: 0}
+        counter = 0
+        self.expanded = 0
+
+        pool = None
+        size = self.batch
+        if self.jobs > 1:
+            pool = Pool(self.jobs, _start_worker,
+                        (self.path, self.level, self.seed))
+            size = max(1, self.batch // self.jobs)
+
+        # The batches being expanded, oldest first, with their results (or,
+        # with workers, where the results will come).
+        pending: Deque[Tuple[List[int], Any]] = deque()
+        try:
+            while True:
+                while (frontier and len(pending) < self.jobs
+                       and self.expanded < self.max_states):
+                    batch: List[int] = []
+                    while frontier and len(batch) < size:
+                        batch.append(heappop(frontier)[2])
+                    self.expanded += len(batch)
+                    work = [states.pop(h) for h in batch]
+                    if pool is None:
+                        pending.append((batch, _expand_all(work)))
+                    else:
+                        pending.append((batch, pool.apply_async(_expand_all, (work,))))
+                if not pending:
+                    break
+                batch, results = pending.popleft()
+                if pool is not None:
+                    results = results.get()
+
+                for h, children in zip(batch, results):
+                    g = depth.pop(h) + 1
+                    for move, ch, distance, won, snap in children:
+                        if ch in parents:
+                            continue
+                        parents[ch] = (h, move)
+                        if won:
+                            return self.__path(parents, ch, start)
+                        counter += 1
+                        states[ch] = snap
+                        depth[ch] = g
+                        heappush(frontier, (g + self.weight*distance, counter, ch))
+
+                if len(frontier) > self.max_frontier:
+                    keep = nsmallest(self.max_frontier // 2, frontier)
+                    for entry in set(frontier).difference(keep):
+                        del states[entry[2]]
+                        del depth[entry[2]]
+                    frontier = keep
+                    heapify(frontier)
+                    parents = self.__prune(parents, [e[2] for e in keep] + [
+                        h for batch, results in pending for h in batch])
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return None
+
+    @staticmethod
+    def __prune(parents: Dict[int, Tuple[int, int]],
+                live: List[int]) -> Dict[int, Tuple[int, int]]:
+        """Return the part of the search tree parents on the paths to the states live."""
+        kept: Dict[int, Tuple[int, int]] = {}
+        for h in live:
+            while h not in kept:
+                kept[h] = parent = parents[h]
+                h = parent[0]
+        return kept
+
+    @staticmethod
+    def __path(parents: Dict[int, Tuple[int, int]], h: int,
+               start: int) -> List[Optional[Move]]:
+        moves: List[Optional[Move]] = []
+        while h != start:
+            h, move = parents[h]
+            if move >= 0:
+                moves.append(MOVES[move])
+        moves.reverse()
+        return moves
+
+
+def write_recording(recfile: Path, playfile: Path, playlevel: str,
+                    seed: int, moves: Sequence[Optional[Move]],
+                    compression: Optional[str] = "gzip") -> None:
+    """Write a recording, which KyeRecordedInput can play back, of the given moves made in a game using the given seed."""
+    writer = KRecordWriter(recfile, playfile, playlevel, seed, compression)
+    for m in moves:
+        writer.write(m)
+    writer.close()
+
+
+def main(argv: Sequence[str]) -> int:
+    """Solve levels as the command line asks; returns the exit status."""
+    parser = argparse.ArgumentParser(
+        prog="Kye-solve",
+        description="Find a way to complete Kye levels, and save each as a recording.")
+    parser.add_argument("levelfile", type=Path, help="the level set")
+    parser.add_argument("levels", nargs="*",
+                        help="the levels to solve (default: all of them)")
+    parser.add_argument("-o", "--output", type=Path, default=Path("."),
+                        help="directory to write the LEVEL.kyr recordings to")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed for the game's random numbers")
+    parser.add_argument("--max-states", type=int, default=200000,
+                        help="give up on a level after expanding this many states")
+    parser.add_argument("--max-frontier", type=int, default=20000,
+                        help="most states to keep waiting for expansion")
+    parser.add_argument("--weight", type=int, default=3,
+                        help="how greedily to head for the diamonds")
+    parser.add_argument("--compression", choices=("gzip", "zstd", "none"),
+                        default="gzip", help="how to compress the recordings")
+    args = parser.parse_args(argv)
+    compression = None if args.compression == "none" else args.compression
+
+    levelset = KLevelSet(args.levelfile)
+    names = levelset.names
+    levelset.close()
+    levels = [name.upper() for name in args.levels] or names
+    unsolved = 0
+    for level in levels:
+        if level not in names:
+            print("%s: no such level" % level)
+            unsolved += 1
+            continue
+        solver = KSolver(args.levelfile, level, seed=args.seed,
+                         jobs=args.jobs, max_states=args.max_states,
+                         max_frontier=args.max_frontier, weight=args.weight)
+        moves = solver.solve()
+        if moves is None:
+            print("%s: no solution found (%d states)" % (level, solver.expanded))
+            unsolved += 1
+            continue
+        recfile = args.output / ("%s.kyr" % level)
+        write_recording(recfile, args.levelfile, level, args.seed, moves,
+                        compression)
+        print("%s: solved in %d moves (%d states), saved to %s"
+              % (level, len(moves), solver.expanded, recfile))
+    return 1 if unsolved else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
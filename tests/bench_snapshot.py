@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Measure how fast KGame.snapshot() and KGame.restore() are, on the shipped levels.
+
+For each level, a game is played for a while to get things moving, then
+snapshots are taken of it tick by tick, and the game is restored to them in
+a different order from the one they were taken in (which is how the solver
+uses them). Run it from the top of the source tree:
+
+    python3 tests/bench_snapshot.py [-n COUNT] [LEVELFILE...]"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from random import Random
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from kye.game import KGame  # noqa: E402
+from kye.levelset import KLevelSet  # noqa: E402
+from kye.rng import KRandom  # noqa: E402
+
+from helpers import LEVELFILES, LEVELS, Moves  # noqa: E402
+
+def bench(levels, name, count):
+    """Return the snapshots and restores per second for level name."""
+    game = KGame(levels, name, Moves(0), KRandom(0), hashing=True)
+    for _ in range(100):
+        game.dotick()
+
+    snapshots = []
+    start = time.perf_counter()
+    for _ in range(count):
+        game.dotick()
+        snapshots.append(game.snapshot())
+    taken = time.perf_counter() - start
+
+    # The ticks played above, less the time playing them.
+    game.restore(snapshots[0])
+    start = time.perf_counter()
+    for _ in range(count):
+        game.dotick()
+    ticks = time.perf_counter() - start
+
+    Random(1).shuffle(snapshots)
+    start = time.perf_counter()
+    for state in snapshots:
+        game.restore(state)
+    restored = time.perf_counter() - start
+    return count / max(taken - ticks, 1e-9), count / restored
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-n", "--count", type=int, default=2000,
+                        help="snapshots to take of each level")
+    parser.add_argument("levelfiles", nargs="*", type=Path,
+                        default=[LEVELS / f for f in LEVELFILES])
+    args = parser.parse_args(argv)
+    total = [0.0, 0.0]
+    n = 0
+    for levelfile in args.levelfiles:
+        levels = KLevelSet(levelfile)
+        for name in levels.names:
+            rates = bench(levels, name, args.count)
+            print("%-12s %10.0f snapshots/s %10.0f restores/s" % ((name,) + rates))
+            total[0] += rates[0]
+            total[1] += rates[1]
+            n += 1
+    if n:
+        print("%-12s %10.0f snapshots/s %10.0f restores/s"
+              % ("mean", total[0] / n, total[1] / n))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
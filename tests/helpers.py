@@ -0,0 +1,56 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Things shared by the tests: where the shipped levels are, and sources of moves for games."""
+
+from pathlib import Path
+from random import Random
+
+LEVELS = Path(__file__).resolve().parent.parent / "levels"
+
+# The level sets shipped with the game.
+LEVELFILES = ("intro.kye", "quests.kye")
+
+MOVES = (None, None, ("rel", -1, 0), ("rel", 1, 0), ("rel", 0, -1),
+         ("rel", 0, 1), ("rel", 1, 1), ("abs", 5, 5))
+
+
+class Moves:
+    """Move source giving random moves, the same for the same seed."""
+
+    def __init__(self, seed):
+        self.random = Random(seed)
+
+    def get_move(self):
+        return self.random.choice(MOVES)
+
+
+class Idle:
+    """Move source which never moves."""
+
+    def get_move(self):
+        return None
+
+
+def random_level(seed, chars):
+    """Return a level set file holding one 30x20 level filled at random from chars."""
+    r = Random(seed)
+    rows = ["5"*30] + ["5" + "".join(r.choice(chars) for _ in range(28)) + "5"
+                       for _ in range(18)] + ["5"*30]
+    rows[1] = "5K" + rows[1][2:]
+    return "1\nRANDOM\nhint\nexit\n" + "\n".join(rows) + "\n\n"
@@ -0,0 +1,60 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Tests that a tick of the game allocates little memory, and keeps none of it."""
+
+import tracemalloc
+
+import pytest
+
+from kye.game import KGame
+from kye.levelset import KLevelSet
+from kye.rng import KRandom
+
+from helpers import LEVELFILES, LEVELS, Idle
+
+# The most a tick may allocate at any one time, once the game has warmed up.
+TICK_BUDGET = 1536
+
+# The most a thousand ticks may leave allocated between them. Steady ticks
+# keep nothing, so this only covers tracemalloc's own bookkeeping.
+KEPT_BUDGET = 1024
+
+
+@pytest.mark.parametrize("levelfile", LEVELFILES)
+def test_tick_allocations(levelfile):
+    levels = KLevelSet(LEVELS / levelfile)
+    for name in levels.names:
+        game = KGame(levels, name, Idle(), KRandom(1))
+        for _ in range(200):
+            game.dotick()
+
+        tracemalloc.start()
+        try:
+            worst = 0
+            start = tracemalloc.get_traced_memory()[0]
+            for _ in range(1000):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                game.dotick()
+                worst = max(worst, tracemalloc.get_traced_memory()[1] - before)
+            kept = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+        assert worst <= TICK_BUDGET, name
+        assert kept <= KEPT_BUDGET, name
@@ -0,0 +1,44 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Tests that KGame.state_hash gives the same fingerprints everywhere."""
+
+from random import Random
+
+from kye.game import KGame, zobrist_key
+from kye.levelset import KLevelSet
+from kye.rng import KRandom
+
+from helpers import LEVELS
+
+
+def test_fixed_hashes():
+    """The hash of the start of a level is the same on every machine and version of Python, whichever generator the game uses."""
+    levels = KLevelSet(LEVELS / "intro.kye")
+    game = KGame(levels, "", None, KRandom(1), hashing=True)
+    assert game.state_hash() == 0x3a62f67ffd8020a6
+    game = KGame(levels, "", None, Random(1), hashing=True)
+    assert game.state_hash() == 0xd6cec8cfc179d4ae
+
+
+def test_keys_on_big_boards():
+    """Objects far down a big board do not share hash keys with other objects."""
+    far = 5000*5000
+    assert zobrist_key(far, 2, 0) != zobrist_key(far - (1 << 24), 3, 0)
+    keys = {zobrist_key(pos, code, 0) for pos in (0, far, 2*far) for code in range(4)}
+    assert len(keys) == 12
@@ -0,0 +1,43 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Tests of KLevelSet and the compiled level sets it keeps."""
+
+import hashlib
+
+import kye.levelset
+from kye.levelset import KLevelSet, compile_levels
+
+from helpers import LEVELS
+
+
+def test_damaged_cache(tmp_path, monkeypatch):
+    """A compiled level set which was cut short is compiled again."""
+    monkeypatch.setattr(kye.levelset, "_cachedir", tmp_path)
+    path = LEVELS / "intro.kye"
+    data = path.read_bytes()
+    compiled = compile_levels(data)
+    cache = tmp_path / ("%s.kyec" % hashlib.sha1(data).hexdigest())
+    for cut in (1, 10, len(compiled) // 2):
+        cache.write_bytes(compiled[:-cut])
+        levels = KLevelSet(path)
+        for n in range(1, len(levels) + 1):
+            width, height, board = levels.level(n)[4:7]
+            assert len(board) == width*height
+        levels.close()
+        assert cache.read_bytes() == compiled
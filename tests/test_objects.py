@@ -0,0 +1,63 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Tests of game objects: the memory they take, and how they behave."""
+
+import io
+import tracemalloc
+
+import pytest
+
+from kye.common import XSIZE, YSIZE
+from kye.game import KGame
+from kye.rng import KRandom
+
+from helpers import Idle
+
+# The most memory one object may take, including what the allocator and the
+# garbage collector add. An object with a __dict__ of the same fields takes
+# well over this.
+OBJECT_BUDGET = 144
+
+
+@pytest.mark.parametrize("char", sorted(KGame.cell_lookup))
+def test_object_size(char):
+    """A full board of one kind of object takes no more than OBJECT_BUDGET bytes per object."""
+    cls, args = KGame.cell_lookup[char]
+    tracemalloc.start()
+    try:
+        objs = [cls(*args) for _ in range(XSIZE*YSIZE)]
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert not hasattr(objs[0], "__dict__")
+    assert size / len(objs) <= OBJECT_BUDGET
+
+
+def test_timer_block_expires_in_pull():
+    """A timer block which runs out while a magnet is pulling on it is just gone."""
+    rows = [list("5"*30)] + [list("5" + " "*28 + "5") for _ in range(18)] + [list("5"*30)]
+    rows[1][1] = "K"
+    rows[8][10] = "s"
+    rows[10][10] = "}"
+    rows[11][10] = "s"
+    level = "1\nTIMER\nhint\nexit\n" + "\n".join("".join(r) for r in rows) + "\n\n"
+    game = KGame(io.StringIO(level), "TIMER", Idle(), KRandom(0))
+    for _ in range(130):
+        game.dotick()
+    assert [game.get_at(10, y) is None for y in range(8, 12)] == [False, True, True, False]
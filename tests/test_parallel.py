@@ -0,0 +1,51 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Tests that games can be played in many threads at once without affecting each other."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from kye.game import KGame
+from kye.levelset import KLevelSet
+from kye.rng import KRandom
+
+from helpers import LEVELFILES, LEVELS, Moves
+
+GAMES = 48
+TICKS = 300
+
+
+def test_threads_match_sequential():
+    """Games played in a thread pool go tick for tick the same as when played one after another."""
+    levelsets = [KLevelSet(LEVELS / levelfile) for levelfile in LEVELFILES]
+    games = [(levels, name) for levels in levelsets for name in levels.names]
+
+    def play(seed):
+        levels, name = games[seed % len(games)]
+        game = KGame(levels, name, Moves(seed), KRandom(seed), hashing=True)
+        hashes = []
+        for _ in range(TICKS):
+            game.dotick()
+            hashes.append(game.state_hash())
+        return hashes
+
+    sequential = [play(seed) for seed in range(GAMES)]
+    with ThreadPoolExecutor(8) as pool:
+        parallel = list(pool.map(play, range(GAMES)))
+    for seed in range(GAMES):
+        assert parallel[seed] == sequential[seed], games[seed % len(games)][1]
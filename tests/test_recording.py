@@ -0,0 +1,43 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Tests of writing recordings and playing them back."""
+
+from pathlib import Path
+
+from kye.recording import KRecordWriter, KyeRecordedInput
+
+
+def test_many_moves(tmp_path):
+    """A recording with more different moves than fit in 16-bit codes plays back as it was written."""
+    playfile = Path("intro.kye")
+    moves = []
+    for i in range(0x10000 + 100):
+        moves.append(None)
+        moves.append(("abs", i % 1000, i // 1000))
+    moves.extend([None] * 5)
+    recfile = tmp_path / "many.kyr"
+    writer = KRecordWriter(recfile, playfile, "FIRST", 1, compression=None)
+    for move in moves:
+        writer.write(move)
+    writer.close()
+
+    playback = KyeRecordedInput(playfile, recfile)
+    assert [playback.get_move() for _ in moves] == moves
+    assert playback.ended and not playback.overrun
+    playback.close()
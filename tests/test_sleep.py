@@ -0,0 +1,105 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Tests that putting stuck objects to sleep (see KGame.dotick) makes no difference to how the game plays."""
+
+import io
+
+import pytest
+
+from kye.game import KGame
+from kye.levelset import KLevelSet
+from kye.objects import Slider
+from kye.rng import KRandom
+from kye.scheduler import KScheduler
+
+from helpers import LEVELFILES, LEVELS, Idle, Moves, random_level
+
+
+def assert_same_play(make, ticks):
+    """Run a game made by make(sleep) with sleep on and with it off, and check that they are the same after every tick."""
+    asleep, awake = make(True), make(False)
+    for _ in range(ticks):
+        asleep.dotick()
+        awake.dotick()
+        assert asleep.state_hash() == awake.state_hash(), asleep.tics
+
+
+@pytest.mark.parametrize("levelfile", LEVELFILES)
+def test_shipped_levels(levelfile):
+    levels = KLevelSet(LEVELS / levelfile)
+    for n, name in enumerate(levels.names):
+        assert_same_play(lambda sleep: KGame(
+            levels, name, Moves(n), KRandom(n), sleep=sleep, hashing=True), 400)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_random_boards(seed):
+    level = random_level(seed, "lrud<>^vLRUDAFsSbe*H     ")
+    assert_same_play(lambda sleep: KGame(
+        io.StringIO(level), "RANDOM", Moves(seed), KRandom(seed),
+        sleep=sleep, hashing=True), 600)
+
+
+def test_sleeping_bucket_skipped():
+    """Objects are not visited while everything in their bucket is asleep, and are again once one wakes."""
+    sched = KScheduler()
+    a, b = Slider(1, 0, False), Slider(1, 0, False)
+    sched.add(1, a)
+    sched.add(1, b)
+    sched.sleep(a)
+    assert list(sched.due(1)) == [a, b]  # the caller skips a itself
+    sched.sleep(b)
+    assert list(sched.due(2)) == []
+    sched.wake(b)
+    assert list(sched.due(3)) == [a, b]
+
+
+def test_stuck_slider_sleeps():
+    """A slider stuck against a wall goes to sleep, and wakes when the wall goes."""
+    rows = ["5"*30] + ["5" + " "*28 + "5"]*18 + ["5"*30]
+    rows[1] = "5K" + " "*25 + "re5"
+    level = "1\nSTUCK\nhint\nexit\n" + "\n".join(rows) + "\n\n"
+    game = KGame(io.StringIO(level), "STUCK", Idle(), KRandom(0))
+    for _ in range(5):
+        game.dotick()
+    assert game.nasleep == 1
+    game.remove_at(28, 1)
+    assert game.nasleep == 0
+    game.dotick()
+    assert game.get_at(28, 1) is not None
+
+
+def test_wake_after_add_joins_tick():
+    """An object woken during a tick joins it, even if its bucket was passed over and has since had an object added (as when a shooter fires)."""
+    sched = KScheduler()
+    first, later, added = Slider(1, 0, False), Slider(1, 0, False), Slider(1, 0, False)
+    other = Slider(1, 0, False)
+    sched.add(1, first, 0)
+    sched.add(1, other, 1)
+    sched.add(1, later, 0)
+    sched.sleep(first)
+    sched.sleep(later)
+
+    thought = []
+    for obj in sched.due(1):
+        thought.append(obj)
+        if obj is other:
+            sched.add(1, added, 0)
+            sched.wake(later)
+    assert thought == [other, later]
@@ -0,0 +1,99 @@
+#    Kye - classic puzzle game
+#    Copyright (C) 2005, 2006, 2007, 2010 Colin Phipps <cph@moria.org.uk>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+
+"""Tests that KGame.restore() brings a game back to a state from KGame.snapshot()."""
+
+from random import Random
+
+import pytest
+
+from kye.game import KGame
+from kye.levelset import KLevelSet
+from kye.rng import KRandom
+
+from helpers import LEVELFILES, LEVELS, Moves
+
+
+@pytest.mark.parametrize("levelfile", LEVELFILES)
+def test_round_trip(levelfile):
+    """Restoring each snapshot of a game, in any order, gives the state hash and snapshot the game had then."""
+    levels = KLevelSet(LEVELS / levelfile)
+    for n, name in enumerate(levels.names):
+        game = KGame(levels, name, Moves(n), KRandom(n), hashing=True)
+        taken = []
+        for _ in range(400):
+            game.dotick()
+            taken.append((game.state_hash(), game.snapshot()))
+
+        other = KGame(levels, name, Moves(n), KRandom(0), hashing=True)
+        Random(n).shuffle(taken)
+        for h, state in taken:
+            other.restore(state)
+            assert other.state_hash() == h, name
+            assert other.snapshot() == state, name
+
+
+def test_dead_kye():
+    """A snapshot taken after the Kye has lost its last life, and so is off the board for good, can be restored."""
+    levels = KLevelSet(LEVELS / "intro.kye")
+    game = KGame(levels, "", Moves(0), KRandom(0), hashing=True)
+    game.dotick()
+    game.kye.lives = 0
+    game.kill_kye(game.kye)
+    for _ in range(100):  # until the ghost has gone
+        game.dotick()
+    assert game.kye is None and game.thekye.x == -1
+    state = game.snapshot()
+    other = KGame(levels, "", Moves(0), KRandom(0), hashing=True)
+    other.restore(state)
+    assert other.kye is None
+    assert other.thekye is not None and other.thekye.x == -1
+    assert other.thekye.lives == game.thekye.lives
+    assert other.state_hash() == game.state_hash()
+    assert other.snapshot() == state
+
+
+def test_restore_without_hash():
+    """A game keeping a state hash gets it right from a snapshot of one which does not."""
+    levels = KLevelSet(LEVELS / "quests.kye")
+    for n, name in enumerate(levels.names):
+        plain = KGame(levels, name, Moves(n), KRandom(n))
+        hashed = KGame(levels, name, Moves(n), KRandom(n), hashing=True)
+        for _ in range(100):
+            plain.dotick()
+            hashed.dotick()
+        other = KGame(levels, name, Moves(n), KRandom(0), hashing=True)
+        other.restore(plain.snapshot())
+        assert other.state_hash() == hashed.state_hash(), name
+
+
+def test_restored_game_plays_on():
+    """A game restored to a snapshot plays on tick for tick as the game it was taken of."""
+    levels = KLevelSet(LEVELS / "quests.kye")
+    for n, name in enumerate(levels.names):
+        game = KGame(levels, name, Moves(n), KRandom(n), hashing=True)
+        for _ in range(100):
+            game.dotick()
+        state = game.snapshot()
+        other = KGame(levels, name, Moves(n), KRandom(0), hashing=True)
+        other.restore(state)
+        other.ms.random.setstate(game.ms.random.getstate())
+        for _ in range(300):
+            game.dotick()
+            other.dotick()
+            assert other.state_hash() == game.state_hash(), name